@@ -4,63 +4,121 @@ DataLens AI - Autonomous Data Analysis Agent
 
 This agent takes natural language questions about data and:
 1. Analyzes the dataset schema
-2. Plans an analysis approach
-3. Generates Python code
-4. Executes code safely
-5. Self-corrects on errors
-6. Reports findings with visualizations
+2. Plans an analysis approach and generates Python code
+   (one Claude call; SPLIT_PLAN_CODE=1 makes them two)
+3. Executes code safely
+4. Self-corrects on errors
+5. Reports findings with visualizations
 """
 
-from typing import TypedDict, Literal
+import os
+import json
+import asyncio
+import hashlib
+from dataclasses import replace
+from functools import lru_cache
+from typing import Literal
+from langgraph.cache.memory import InMemoryCache
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import CachePolicy
 
 from app.nodes import (
     analyze_schema,
     create_analysis_plan,
     generate_code,
+    warm_coder_cache,
+    plan_and_code,
+    SPLIT_PLAN_CODE,
     execute_code,
     debug_code,
     generate_report
 )
+from app.state import AgentState
+from app.utils.df_cache import df_key
+from app.utils.llm_cache import (
+    CACHE_ENABLED,
+    InflightAbandoned,
+    abandon_inflight,
+    await_inflight,
+    claim_inflight,
+    get_cache,
+    make_key,
+    parse_ttl,
+    release_inflight
+)
+from app.utils.semantic_cache import get_semantic_cache, schema_fingerprint
+
+
+# --- NODE CACHE ---
+# The schema analyzer only depends on the file and the planner only on the
+# schema + question, so re-running them with the same inputs in the same
+# process just returns the earlier result. The cache is in-memory and per
+# process: with several workers each keeps its own copy, and NODE_CACHE_TTL
+# (seconds) bounds how long entries - which hold the schema text - live.
+NODE_CACHE_TTL = int(os.getenv("NODE_CACHE_TTL", "3600"))
+_NODE_CACHE = InMemoryCache()
+
+
+def _schema_cache_key(state: AgentState) -> str:
+    """The file's path and modification time identify its schema."""
+    file_path = state.file_path
+    return f"{os.path.abspath(file_path)}:{os.path.getmtime(file_path)}"
 
 
-# --- STATE DEFINITION ---
-class AgentState(TypedDict):
+def _planner_cache_key(state: AgentState) -> str:
+    """The plan only depends on the dataset description and the question."""
+    payload = "\0".join([
+        state.schema_info,
+        state.sample_rows,
+        state.user_question
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _plan_and_code_cache_key(state: AgentState) -> str:
     """
-    The state that flows through our agent graph.
+    Like the planner's key, plus the file path.
     
-    Think of this as a "baton" in a relay race that accumulates
-    information as it passes through each node.
+    The prompt includes the path and Claude may write it into the code,
+    so code cached for one file must not be replayed for another with
+    the same contents.
     """
-    
-    # Input
-    file_path: str              # Path to the uploaded CSV
-    user_question: str          # What the user wants to know
-    
-    # Schema analysis output
-    schema_info: str            # Structured description of the data
-    column_types: dict          # Column name -> data type mapping
-    sample_rows: str            # String representation of sample data
-    
-    # Planning output
-    analysis_plan: str          # Step-by-step plan in natural language
-    
-    # Code generation output
-    generated_code: str         # Python code to execute
-    
-    # Execution output
-    execution_result: str       # Output from running the code
-    execution_error: str        # Error message if execution failed
-    figure_json: str            # Plotly figure as JSON (if visualization)
-    
-    # Debugging
-    debug_attempts: int         # Number of debug attempts (max 3)
-    
-    # Final output
-    final_report: str           # Human-readable analysis report
+    payload = "\0".join([
+        os.path.abspath(state.file_path),
+        _planner_cache_key(state)
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# How long finished analyses stay in the on-disk response cache
+RUN_CACHE_TTL = parse_ttl("7d")
+
+# Analyses whose Plotly figure is bigger than this (characters of JSON)
+# aren't stored: replaying one only saves Claude calls, and the figure
+# would take up most of the cache file
+RUN_CACHE_MAX_FIGURE_CHARS = 1024 * 1024
 
 
 # --- ROUTING FUNCTIONS ---
+# Nodes that only need the schema; they run in parallel
+if SPLIT_PLAN_CODE:
+    SCHEMA_DEPENDENTS = ["planner", "coder_warmup"]
+else:
+    SCHEMA_DEPENDENTS = ["plan_and_code"]
+
+
+def route_start(state: AgentState):
+    """
+    Skip the schema analyzer when the caller already filled in the schema.
+    
+    run_analysis does this when it needs the schema up front to look up
+    the semantic answer cache.
+    """
+    if state.schema_info:
+        return SCHEMA_DEPENDENTS
+    return "schema_analyzer"
+
+
 def should_debug(state: AgentState) -> Literal["debug", "report"]:
     """
     Decide whether to debug or proceed to reporting.
@@ -69,8 +127,8 @@ def should_debug(state: AgentState) -> Literal["debug", "report"]:
     - If there's an error AND we haven't tried 3 times -> debug
     - Otherwise -> proceed to report
     """
-    has_error = bool(state.get("execution_error"))
-    attempts = state.get("debug_attempts", 0)
+    has_error = bool(state.execution_error)
+    attempts = state.debug_attempts
     
     if has_error and attempts < 3:
         return "debug"
@@ -78,40 +136,94 @@ def should_debug(state: AgentState) -> Literal["debug", "report"]:
         return "report"
 
 
+def route_after_debug(state: AgentState) -> Literal["execute", "debug", "report"]:
+    """
+    Send the fixed code to the executor, unless the debugger already ran it.
+    
+    In speculative mode (SPECULATIVE_DEBUG=1) the debugger executes its
+    candidate fixes itself, so the result is routed like the executor's.
+    """
+    if not state.debug_executed:
+        return "execute"
+    return should_debug(state)
+
+
 # --- BUILD THE GRAPH ---
+@lru_cache(maxsize=1)
 def create_agent():
     """
     Create the DataLens AI agent graph.
     
-    Flow:
-    START -> schema_analyzer -> planner -> coder -> executor
-                                                        |
-                                                (check for errors)
-                                                        |
-                                            +-----------+-----------+
-                                            |                       |
-                                            v                       v
-                                        [debug]                 [report]
-                                            |                       |
-                                            v                       v
-                                        executor                   END
+    The graph is built and compiled once per process; later calls return
+    the same compiled graph. It holds no per-run state, so concurrent
+    ainvoke() calls with different inputs can share it.
+    
+    Flow (default):
+    START -> [schema_analyzer] -> plan_and_code -> executor -> ...
+    
+    Flow with SPLIT_PLAN_CODE=1:
+                                +-> planner --------+
+    START -> [schema_analyzer] -+                   +-> coder -> executor
+                                +-> coder_warmup ---+                |
+                                                             (check for errors)
+                                                                     |
+                                                         +-----------+-----------+
+                                                         |                       |
+                                                         v                       v
+                                                     [debug]                 [report]
+                                                         |                       |
+                                                         v                       v
+                                                     executor                   END
+    
+    A speculative debug attempt has already run its fix, so it is routed
+    like the executor's output instead of going back to the executor.
     """
     
     workflow = StateGraph(AgentState)
     
     # Add all nodes
-    workflow.add_node("schema_analyzer", analyze_schema)
-    workflow.add_node("planner", create_analysis_plan)
-    workflow.add_node("coder", generate_code)
+    workflow.add_node(
+        "schema_analyzer",
+        analyze_schema,
+        cache_policy=CachePolicy(key_func=_schema_cache_key, ttl=NODE_CACHE_TTL)
+    )
+    if SPLIT_PLAN_CODE:
+        workflow.add_node(
+            "planner",
+            create_analysis_plan,
+            cache_policy=CachePolicy(key_func=_planner_cache_key, ttl=NODE_CACHE_TTL)
+        )
+        workflow.add_node("coder_warmup", warm_coder_cache)
+        workflow.add_node("coder", generate_code)
+    else:
+        workflow.add_node(
+            "plan_and_code",
+            plan_and_code,
+            cache_policy=CachePolicy(key_func=_plan_and_code_cache_key, ttl=NODE_CACHE_TTL)
+        )
     workflow.add_node("executor", execute_code)
     workflow.add_node("debugger", debug_code)
     workflow.add_node("reporter", generate_report)
     
     # Define the flow
-    workflow.add_edge(START, "schema_analyzer")
-    workflow.add_edge("schema_analyzer", "planner")
-    workflow.add_edge("planner", "coder")
-    workflow.add_edge("coder", "executor")
+    workflow.add_conditional_edges(
+        START,
+        route_start,
+        ["schema_analyzer"] + SCHEMA_DEPENDENTS
+    )
+    
+    if SPLIT_PLAN_CODE:
+        # Fan out: the planner and the coder's prompt-cache warmup both only
+        # need the schema, so they run at the same time...
+        for node in SCHEMA_DEPENDENTS:
+            workflow.add_edge("schema_analyzer", node)
+        
+        # ...and the coder waits for both
+        workflow.add_edge(SCHEMA_DEPENDENTS, "coder")
+        workflow.add_edge("coder", "executor")
+    else:
+        workflow.add_edge("schema_analyzer", "plan_and_code")
+        workflow.add_edge("plan_and_code", "executor")
     
     # Conditional routing after execution
     workflow.add_conditional_edges(
@@ -123,51 +235,185 @@ def create_agent():
         }
     )
     
-    # Debugger goes back to executor to retry
-    workflow.add_edge("debugger", "executor")
+    # Debugger goes back to executor to retry (unless it already did)
+    workflow.add_conditional_edges(
+        "debugger",
+        route_after_debug,
+        {
+            "execute": "executor",
+            "debug": "debugger",
+            "report": "reporter"
+        }
+    )
     
     # Reporter ends the flow
     workflow.add_edge("reporter", END)
     
-    return workflow.compile()
+    # The compiled graph supports both invoke() and ainvoke(). The node
+    # cache is shared by every graph built in this process.
+    return workflow.compile(cache=_NODE_CACHE)
 
 
-def run_analysis(file_path: str, question: str) -> dict:
+async def run_analysis(file_path: str, question: str, on_token=None,
+                       on_progress=None, on_update=None) -> dict:
     """
     Run the DataLens AI agent on a dataset.
     
+    This is a coroutine; from synchronous code call it with
+    asyncio.run(run_analysis(...)).
+    
+    Identical requests (same file contents by path + modification time,
+    same question) are coalesced: a duplicate that arrives while the
+    first is running waits for its result, and clean results (unless
+    their figure is over RUN_CACHE_MAX_FIGURE_CHARS) are kept in the
+    on-disk response cache for 7 days (LLM_CACHE=0 disables both). Such callers
+    get the final state only - nothing is sent to their callbacks.
+    
+    If a question similar enough to this one was already answered on the
+    same dataset (see app.utils.semantic_cache), the stored result is
+    returned without running the agent.
+    
     Args:
         file_path: Path to the CSV file
         question: User's analysis question
+        on_token: Optional on_token(node, text) callback that receives the
+            coder's and reporter's output while it is streamed
+        on_progress: Optional on_progress(node) callback, called with the
+            node's name each time a node starts
+        on_update: Optional on_update(node, update) callback, called with
+            the fields a node changed each time it finishes
         
     Returns:
         Final agent state with results
     """
+    if not CACHE_ENABLED:
+        return await _run_analysis(file_path, question, on_token, on_progress, on_update)
+    
+    key = make_key("run_analysis", df_key(file_path), question)
+    while True:
+        hit = get_cache().get(key, RUN_CACHE_TTL)
+        if hit is not None:
+            cached_state = json.loads(hit)
+            cached_state["file_path"] = file_path
+            return cached_state
+        
+        future, is_owner = claim_inflight(key)
+        if is_owner:
+            break
+        try:
+            # Copy, so callers can't modify each other's result
+            return dict(await await_inflight(future))
+        except InflightAbandoned:
+            # The first caller was cancelled; run it ourselves
+            continue
+    
+    try:
+        final_state = await _run_analysis(
+            file_path, question, on_token, on_progress, on_update
+        )
+        
+        # Only remember analyses that actually ran cleanly, and whose
+        # figure is small enough to keep
+        figure_json = final_state.get("figure_json") or ""
+        if (not final_state.get("execution_error")
+                and len(figure_json) <= RUN_CACHE_MAX_FIGURE_CHARS):
+            get_cache().set(key, json.dumps(dict(final_state), default=str))
+        
+        future.set_result(final_state)
+        return final_state
+    except asyncio.CancelledError:
+        abandon_inflight(key, future)
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        release_inflight(key, future)
+
+
+async def _run_analysis(file_path: str, question: str, on_token=None,
+                        on_progress=None, on_update=None) -> dict:
+    """Run the agent (or answer from the semantic cache); see run_analysis."""
     agent = create_agent()
     
-    initial_state = {
-        "file_path": file_path,
-        "user_question": question,
-        "schema_info": "",
-        "column_types": {},
-        "sample_rows": "",
-        "analysis_plan": "",
-        "generated_code": "",
-        "execution_result": "",
-        "execution_error": "",
-        "figure_json": "",
-        "debug_attempts": 0,
-        "final_report": ""
-    }
-    
-    final_state = agent.invoke(initial_state)
+    initial_state = AgentState(file_path=file_path, user_question=question)
+    
+    semantic_cache = await asyncio.to_thread(get_semantic_cache)
+    fingerprint = None
+    
+    if semantic_cache is not None:
+        # The cache is namespaced per dataset, so we need the schema first
+        if on_progress is not None:
+            on_progress("schema_analyzer")
+        schema = await asyncio.to_thread(analyze_schema, initial_state)
+        if on_update is not None:
+            on_update("schema_analyzer", schema)
+        initial_state = replace(initial_state, **schema)
+        fingerprint = schema_fingerprint(
+            initial_state.column_types,
+            initial_state.schema_info
+        )
+        
+        cached_state = await asyncio.to_thread(
+            semantic_cache.lookup, fingerprint, question
+        )
+        if cached_state is not None:
+            cached_state["file_path"] = file_path
+            cached_state["user_question"] = question
+            return cached_state
+    
+    config = {"configurable": {"on_token": on_token}} if on_token else None
+    
+    # "tasks" events mark nodes starting (no "result" yet) and finishing;
+    # the last "values" event is the final state, as ainvoke would return
+    final_state = None
+    async for mode, chunk in agent.astream(
+        initial_state, config, stream_mode=["tasks", "values"]
+    ):
+        if mode == "values":
+            final_state = chunk
+        elif "result" not in chunk:
+            if on_progress is not None:
+                on_progress(chunk["name"])
+        elif on_update is not None and chunk["result"]:
+            on_update(chunk["name"], chunk["result"])
+    
+    # Only remember analyses that actually ran cleanly
+    if fingerprint is not None and not final_state.get("execution_error"):
+        await asyncio.to_thread(
+            semantic_cache.store, fingerprint, question, dict(final_state)
+        )
     
     return final_state
 
 
+async def run_analyses(file_path: str, questions: list) -> list:
+    """
+    Answer several questions about the same dataset concurrently.
+    
+    The runs overlap their network waits; the number of Claude
+    requests in flight is still capped by LLM_CONCURRENCY.
+    
+    Args:
+        file_path: Path to the CSV file
+        questions: List of analysis questions
+        
+    Returns:
+        List of final agent states, in the same order as questions
+    """
+    return await asyncio.gather(
+        *(run_analysis(file_path, question) for question in questions)
+    )
+
+
 # --- TEST ---
 if __name__ == "__main__":
     import os
+    import logging
+    
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
     
     print("Testing DataLens AI Agent (Phase 1)...\n")
     
@@ -184,10 +430,10 @@ if __name__ == "__main__":
         f.write(test_csv)
     
     # Run the agent
-    result = run_analysis(
+    result = asyncio.run(run_analysis(
         file_path="data/test_churn.csv",
         question="What factors influence customer churn?"
-    )
+    ))
     
     print("=" * 50)
     print("SCHEMA INFO:")
@@ -1,6 +1,25 @@
-from app.nodes.schema_analyzer import analyze_schema
-from app.nodes.planner import create_analysis_plan
-from app.nodes.coder import generate_code
-from app.nodes.executor import execute_code
-from app.nodes.debugger import debug_code
-from app.nodes.reporter import generate_report
\ No newline at end of file
+import importlib
+
+# Nodes are imported on first access (`from app.nodes import debug_code`
+# only loads app.nodes.debugger), so importing the package is cheap.
+_EXPORTS = {
+    "analyze_schema": "schema_analyzer",
+    "create_analysis_plan": "planner",
+    "generate_code": "coder",
+    "warm_coder_cache": "coder",
+    "plan_and_code": "plan_and_code",
+    "SPLIT_PLAN_CODE": "plan_and_code",
+    "execute_code": "executor",
+    "debug_code": "debugger",
+    "generate_report": "reporter",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
\ No newline at end of file
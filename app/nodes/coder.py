@@ -4,72 +4,102 @@ Coder Node
 Generates Python code based on the analysis plan and dataset schema.
 """
 
-from app.utils.llm import call_llm
-from app.utils.prompts import CODER_PROMPT
+import os
+import asyncio
+import logging
+from typing import Optional
 
+from langchain_core.runnables import RunnableConfig
 
-def generate_code(state: dict) -> dict:
+from app.state import AgentState
+from app.utils.llm import astream_llm, collect, awarm_prompt_cache, dataset_system, token_callback
+from app.utils.prompts import CODER_SYSTEM_PROMPT, render_coder
+from app.utils.text import strip_markdown_fence
+
+# Set CODER_PREWARM=0 to skip writing the coder's prompt cache early
+CODER_PREWARM = os.getenv("CODER_PREWARM", "1") != "0"
+
+logger = logging.getLogger("datalens.coder")
+
+
+def build_coder_system(state: AgentState) -> list:
+    """Dataset description + static instructions (cached by Claude)."""
+    return dataset_system(CODER_SYSTEM_PROMPT, state.schema_info, state.sample_rows)
+
+
+async def warm_coder_cache(state: AgentState) -> dict:
+    """
+    Write the coder's prompt cache while the planner is still running.
+    
+    The coder's system blocks only depend on the schema, so they can be
+    sent as soon as it exists. When the coder runs after the planner,
+    its prefix is already cached and its first token comes back sooner.
+    
+    Args:
+        state: Current agent state with schema_info and sample_rows
+        
+    Returns:
+        Empty update; this node does not change the state
+    """
+    if CODER_PREWARM:
+        try:
+            await awarm_prompt_cache(build_coder_system(state))
+        except Exception as e:
+            # Only an optimization - the coder works without it
+            logger.warning("Could not pre-warm coder prompt cache: %s", e)
+    
+    return {}
+
+
+async def generate_code(state: AgentState, config: Optional[RunnableConfig] = None) -> dict:
     """
     Generate Python code to perform the analysis.
     
+    The code is streamed to the caller's on_token callback, if there is
+    one, while Claude writes it; the full text is logged at DEBUG level.
+    
     Args:
         state: Current agent state
+        config: LangGraph run config (may carry on_token)
         
     Returns:
-        Updated state with generated_code
+        State update with generated_code
     """
     
-    # Fill in the prompt template
-    prompt = CODER_PROMPT.format(
-        schema_info=state["schema_info"],
-        sample_rows=state["sample_rows"],
-        analysis_plan=state["analysis_plan"],
-        user_question=state["user_question"],
-        file_path=state["file_path"]
+    # Same system blocks as warm_coder_cache, so the cache hits
+    system = build_coder_system(state)
+    
+    # Only the per-request details go in the user message
+    prompt = render_coder(
+        analysis_plan=state.analysis_plan,
+        user_question=state.user_question,
+        file_path=state.file_path
     )
     
-    # Call Claude
-    code = call_llm(prompt, max_tokens=2048)
+    # Call Claude, passing on the code as it arrives
+    code = await collect(
+        astream_llm(prompt, max_tokens=2048, system=system),
+        token_callback(config, "coder")
+    )
     
     # Clean up the code (remove markdown if present)
-    code = clean_code_output(code)
+    code = strip_markdown_fence(code)
+    logger.debug("💻 GENERATED CODE:\n%s", code)
     
     # Update state
-    state["generated_code"] = code
-    
-    print("\n" + "=" * 50)
-    print("💻 GENERATED CODE:")
-    print("=" * 50)
-    print(code)
-    
-    return state
-
-
-def clean_code_output(code: str) -> str:
-    """
-    Clean up LLM code output.
-    
-    Sometimes Claude wraps code in markdown blocks despite instructions.
-    This removes that wrapping.
-    """
-    # Remove markdown code blocks if present
-    if code.startswith("```python"):
-        code = code[9:]  # Remove ```python
-    elif code.startswith("```"):
-        code = code[3:]  # Remove ```
-    
-    if code.endswith("```"):
-        code = code[:-3]  # Remove trailing ```
-    
-    return code.strip()
+    return {"generated_code": code}
 
 
 # Test independently
 if __name__ == "__main__":
-    test_state = {
-        "file_path": "data/test_churn.csv",
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
+    test_state = AgentState(
+        file_path="data/test_churn.csv",
         
-        "schema_info": """Dataset Overview:
+        schema_info="""Dataset Overview:
 - Total Rows: 5
 - Total Columns: 7
 
@@ -82,19 +112,19 @@ Column Details:
   • total_charges (float64): total amount paid
   • churn (object): Yes/No - did customer leave""",
         
-        "sample_rows": """| customer_id | age | gender | tenure_months | monthly_charges | churn |
+        sample_rows="""| customer_id | age | gender | tenure_months | monthly_charges | churn |
 |-------------|-----|--------|---------------|-----------------|-------|
 | 1           | 34  | Male   | 12            | 65.5            | No    |
 | 2           | 56  | Female | 45            | 89.2            | No    |""",
         
-        "analysis_plan": """1. Load the data and check the churn distribution
+        analysis_plan="""1. Load the data and check the churn distribution
 2. Compare average tenure_months between churned and non-churned customers
 3. Compare average monthly_charges between groups
 4. Create a bar chart showing churn rate by different factors
 5. Summarize the key differences""",
         
-        "user_question": "What factors are most associated with customer churn?"
-    }
+        user_question="What factors are most associated with customer churn?"
+    )
     
-    result = generate_code(test_state)
+    result = asyncio.run(generate_code(test_state))
     print("\n✅ Coder test complete!")
\ No newline at end of file
@@ -5,11 +5,97 @@ Analyzes execution errors and generates corrected code.
 Implements self-correction loop with up to 3 retry attempts.
 """
 
-from app.utils.llm import call_llm
-from app.utils.prompts import DEBUGGER_PROMPT
+import os
+import asyncio
+import logging
 
+from app.state import AgentState
+from app.tools.code_executor import USE_WORKER, aexecute_code_safely
+from app.utils.llm import acall_llm, dataset_system
+from app.utils.prompts import DEBUGGER_SYSTEM_PROMPT, render_debugger
+from app.utils.text import strip_markdown_fence
 
-def debug_code(state: dict) -> dict:
+# Set SPECULATIVE_DEBUG=1 to try several fixes at once on the first debug
+# attempt: recovers in one round more often, at the cost of extra tokens
+SPECULATIVE_DEBUG = os.getenv("SPECULATIVE_DEBUG", "0") == "1"
+
+# One candidate fix per temperature
+SPECULATIVE_TEMPERATURES = (0.0, 0.5)
+
+logger = logging.getLogger("datalens.debugger")
+
+
+async def _try_fix(prompt: str, system: list, temperature: float,
+                   df_key: tuple) -> tuple:
+    """Ask Claude for one fix and run it: (code, output, error, figure_json)."""
+    fixed_code = await acall_llm(
+        prompt, max_tokens=2048, system=system, temperature=temperature
+    )
+    fixed_code = strip_markdown_fence(fixed_code)
+    
+    output, error, figure_json = await aexecute_code_safely(fixed_code, df_key=df_key)
+    return fixed_code, output, error, figure_json
+
+
+async def _speculative_fix(prompt: str, system: list, df_key: tuple) -> tuple:
+    """
+    Write and run one fix per SPECULATIVE_TEMPERATURES concurrently.
+    
+    Returns the first candidate that runs without error and cancels the
+    rest; if none does, returns the last one to finish.
+    """
+    pending = {
+        asyncio.create_task(_try_fix(prompt, system, temperature, df_key))
+        for temperature in SPECULATIVE_TEMPERATURES
+    }
+    fallback, failure = None, None
+    
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    failure = e
+                    continue
+                
+                if not result[2]:
+                    return result
+                fallback = result
+    finally:
+        # Cancelling also stops a candidate's code if it is running
+        for task in pending:
+            task.cancel()
+    
+    if fallback is None:
+        raise failure
+    return fallback
+
+
+async def _batched_fix(prompt: str, system: list, df_key: tuple) -> tuple:
+    """
+    Write one fix per SPECULATIVE_TEMPERATURES concurrently, then run them.
+    
+    For in-process execution, where candidates can't run side by side:
+    the Claude calls still overlap, and the fixes are run one at a time
+    (skipping duplicates) until one works. Returns the last one run.
+    """
+    fixes = await asyncio.gather(*(
+        acall_llm(prompt, max_tokens=2048, system=system, temperature=temperature)
+        for temperature in SPECULATIVE_TEMPERATURES
+    ))
+    
+    for fixed_code in dict.fromkeys(map(strip_markdown_fence, fixes)):
+        output, error, figure_json = await aexecute_code_safely(fixed_code, df_key=df_key)
+        if not error:
+            break
+    return fixed_code, output, error, figure_json
+
+
+async def debug_code(state: AgentState) -> dict:
     """
     Analyze the error and fix the generated code.
     
@@ -17,85 +103,101 @@ def debug_code(state: dict) -> dict:
         state: Current agent state with execution_error
         
     Returns:
-        Updated state with fixed generated_code and incremented debug_attempts
+        State update with fixed generated_code and incremented debug_attempts.
+        After a speculative attempt the fix has already been run, so the
+        execution fields are filled in and debug_executed is True.
     """
     
     # Increment attempt counter
-    attempts = state.get("debug_attempts", 0) + 1
-    state["debug_attempts"] = attempts
+    attempts = state.debug_attempts + 1
     
-    print("\n" + "=" * 50)
-    print(f"🔧 DEBUGGING (Attempt {attempts}/3)")
-    print("=" * 50)
+    logger.debug("🔧 DEBUGGING (Attempt %d/3)", attempts)
     
     # Get error details
-    error = state.get("execution_error", "Unknown error")
-    original_code = state.get("generated_code", "")
+    error = state.execution_error or "Unknown error"
+    original_code = state.generated_code
     
-    print(f"\n❌ Error to fix:\n{error[:300]}...")
+    logger.debug("❌ Error to fix:\n%.300s...", error)
+    
+    # Keep the system blocks identical on every attempt so retries
+    # 2 and 3 hit the prompt cache written by attempt 1 (the dataset
+    # block is also shared with the earlier nodes)
+    system = dataset_system(
+        DEBUGGER_SYSTEM_PROMPT, state.schema_info, state.sample_rows
+    )
     
     # Ask Claude to fix it
-    prompt = DEBUGGER_PROMPT.format(
+    prompt = render_debugger(
         generated_code=original_code,
-        execution_error=error,
-        schema_info=state.get("schema_info", "")
+        execution_error=error
     )
     
-    fixed_code = call_llm(prompt, max_tokens=2048)
-    
-    # Clean up the code
-    fixed_code = clean_code_output(fixed_code)
-    
-    # Update state with fixed code
-    state["generated_code"] = fixed_code
-    
-    # Clear the error so executor can try again
-    state["execution_error"] = ""
+    if SPECULATIVE_DEBUG and attempts == 1:
+        logger.debug("🔀 Trying %d fixes in parallel...", len(SPECULATIVE_TEMPERATURES))
+        
+        # Worker processes are needed to run candidates side by side
+        speculate = _speculative_fix if USE_WORKER else _batched_fix
+        fixed_code, output, error, figure_json = await speculate(
+            prompt, system, state.df_key
+        )
+        
+        if error:
+            logger.debug("❌ No candidate fix ran cleanly:\n%.500s", error)
+        else:
+            logger.debug("✅ Candidate fix ran successfully:\n%s", fixed_code)
+        
+        return {
+            "debug_attempts": attempts,
+            "generated_code": fixed_code,
+            "execution_result": output,
+            "execution_error": error,
+            "figure_json": figure_json if figure_json else "",
+            "debug_executed": True
+        }
     
-    print("\n✅ Code fixed. Sending back to executor...")
-    print("-" * 50)
-    print(fixed_code[:500])
-    if len(fixed_code) > 500:
-        print("... (truncated)")
+    fixed_code = await acall_llm(prompt, max_tokens=2048, system=system)
     
-    return state
-
-
-def clean_code_output(code: str) -> str:
-    """Remove markdown code blocks if present."""
-    if code.startswith("```python"):
-        code = code[9:]
-    elif code.startswith("```"):
-        code = code[3:]
+    # Clean up the code
+    fixed_code = strip_markdown_fence(fixed_code)
     
-    if code.endswith("```"):
-        code = code[:-3]
+    logger.debug("✅ Code fixed. Sending back to executor...\n%s", fixed_code)
     
-    return code.strip()
+    # Update state with fixed code, and clear the error so the executor
+    # can try again
+    return {
+        "debug_attempts": attempts,
+        "generated_code": fixed_code,
+        "execution_error": "",
+        "debug_executed": False
+    }
 
 
 # Test independently
 if __name__ == "__main__":
-    test_state = {
-        "generated_code": """
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
+    test_state = AgentState(
+        generated_code="""
 import pandas as pd
 df = pd.read_csv('data/test_churn.csv')
 print(df['nonexistent_column'].mean())
 """,
-        "execution_error": """Traceback (most recent call last):
+        execution_error="""Traceback (most recent call last):
   File "<string>", line 3, in <module>
 KeyError: 'nonexistent_column'
 """,
-        "schema_info": """Column Details:
+        schema_info="""Column Details:
   • customer_id (int64)
   • age (int64)
   • gender (object)
   • tenure_months (int64)
   • monthly_charges (float64)
   • churn (object)""",
-        "debug_attempts": 0
-    }
+        debug_attempts=0
+    )
     
-    result = debug_code(test_state)
+    result = asyncio.run(debug_code(test_state))
     print(f"\n\nDebug attempts: {result['debug_attempts']}")
     print(f"Fixed code:\n{result['generated_code']}")
\ No newline at end of file
@@ -5,75 +5,75 @@ Safely executes generated Python code and captures output,
 errors, and visualizations.
 """
 
+import logging
+
+from app.state import AgentState
 from app.tools.code_executor import execute_code_safely
 
+logger = logging.getLogger("datalens.executor")
+
 
-def execute_analysis_code(state: dict) -> dict:
+def execute_analysis_code(state: AgentState) -> dict:
     """
     Execute the generated analysis code.
     
     Args:
-        state: Current agent state with 'generated_code'
+        state: Current agent state with generated_code
         
     Returns:
-        Updated state with execution_result, execution_error, figure_json
+        State update with execution_result, execution_error, figure_json
     """
     
-    code = state.get("generated_code", "")
+    code = state.generated_code
     
     if not code:
-        state["execution_error"] = "No code to execute"
-        state["execution_result"] = ""
-        return state
+        return {"execution_error": "No code to execute", "execution_result": ""}
     
-    print("\n" + "=" * 50)
-    print("🚀 EXECUTING CODE...")
-    print("=" * 50)
+    logger.debug("🚀 EXECUTING CODE...")
     
-    # Execute the code
-    output, error, figure_json = execute_code_safely(code)
-    
-    # Update state
-    state["execution_result"] = output
-    state["execution_error"] = error
-    state["figure_json"] = figure_json if figure_json else ""
+    # Execute the code. The worker process keeps the parsed DataFrame
+    # between runs, so debug retries don't parse the CSV again.
+    output, error, figure_json = execute_code_safely(code, df_key=state.df_key)
     
-    # Print status
+    # Log status (%.Ns truncates lazily, only if DEBUG is on)
     if error:
-        print("\n❌ EXECUTION FAILED:")
-        print("-" * 50)
-        print(error[:500])  # First 500 chars of error
-        if len(error) > 500:
-            print("... (error truncated)")
+        logger.debug("❌ EXECUTION FAILED:\n%.500s", error)
     else:
-        print("\n✅ EXECUTION SUCCESSFUL:")
-        print("-" * 50)
-        print(output[:1000] if len(output) > 1000 else output)
+        logger.debug("✅ EXECUTION SUCCESSFUL:\n%.1000s", output)
         if figure_json:
-            print("\n📊 Plotly figure generated!")
+            logger.debug("📊 Plotly figure generated!")
     
-    return state
+    # Update state
+    return {
+        "execution_result": output,
+        "execution_error": error,
+        "figure_json": figure_json if figure_json else ""
+    }
 
 
 # Keep the old name for backward compatibility with agent.py
-def execute_code(state: dict) -> dict:
+def execute_code(state: AgentState) -> dict:
     """Wrapper to maintain compatibility."""
     return execute_analysis_code(state)
 
 
 # Test independently
 if __name__ == "__main__":
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
     # Test with working code
     print("TEST 1: Working code")
-    test_state = {
-        "generated_code": """
+    test_state = AgentState(
+        generated_code="""
 import pandas as pd
 print("Loading data...")
 df = pd.DataFrame({'a': [1,2,3], 'b': [4,5,6]})
 print(f"Data shape: {df.shape}")
 print(df)
 """
-    }
+    )
     
     result = execute_analysis_code(test_state)
     print(f"\nExecution result: {result['execution_result']}")
@@ -82,13 +82,13 @@ print(df)
     # Test with broken code
     print("\n" + "=" * 50)
     print("TEST 2: Broken code")
-    test_state_2 = {
-        "generated_code": """
+    test_state_2 = AgentState(
+        generated_code="""
 import pandas as pd
 df = pd.read_csv('nonexistent_file.csv')
 print(df)
 """
-    }
+    )
     
     result = execute_analysis_code(test_state_2)
     print(f"\nHas error: {bool(result['execution_error'])}")
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Plan-and-Code Node
+
+Writes the analysis plan and the code in one Claude call.
+
+The planner's output used to be fed to the coder verbatim, which meant
+two round-trips back to back before anything could run. Here Claude
+returns both through the emit_analysis tool, so the happy path makes
+one call fewer. Set SPLIT_PLAN_CODE=1 to use the separate planner and
+coder nodes instead (e.g. to compare the two or debug the plan alone).
+"""
+
+import os
+import json
+import asyncio
+import logging
+
+from app.state import AgentState
+from app.utils.llm import acall_llm_tool, dataset_system
+from app.utils.prompts import PLAN_AND_CODE_SYSTEM_PROMPT, render_plan_and_code
+from app.utils.text import strip_markdown_fence
+
+SPLIT_PLAN_CODE = os.getenv("SPLIT_PLAN_CODE", "0") == "1"
+
+logger = logging.getLogger("datalens.plan_and_code")
+
+EMIT_ANALYSIS_TOOL = {
+    "name": "emit_analysis",
+    "description": "Submit the analysis plan and the Python code that carries it out.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "plan": {
+                "type": "string",
+                "description": "Numbered analysis plan, 3-6 steps"
+            },
+            "code": {
+                "type": "string",
+                "description": "Executable Python code following the plan"
+            }
+        },
+        "required": ["plan", "code"]
+    }
+}
+
+
+async def plan_and_code(state: AgentState) -> dict:
+    """
+    Create the analysis plan and the code for it in a single call.
+    
+    Args:
+        state: Current agent state with schema_info and sample_rows
+    
+    Returns:
+        State update with analysis_plan and generated_code
+    """
+    
+    # Dataset description + instructions go in cached system blocks
+    system = dataset_system(
+        PLAN_AND_CODE_SYSTEM_PROMPT, state.schema_info, state.sample_rows
+    )
+    
+    prompt = render_plan_and_code(
+        user_question=state.user_question,
+        file_path=state.file_path
+    )
+    
+    # Call Claude; the reply is the emit_analysis tool's arguments
+    result = json.loads(await acall_llm_tool(
+        prompt, EMIT_ANALYSIS_TOOL, max_tokens=3072, system=system
+    ))
+    plan = result["plan"].strip()
+    code = strip_markdown_fence(result["code"])
+    
+    logger.debug("📋 ANALYSIS PLAN GENERATED:\n%s", plan)
+    logger.debug("💻 GENERATED CODE:\n%s", code)
+    
+    return {"analysis_plan": plan, "generated_code": code}
+
+
+# Test independently
+if __name__ == "__main__":
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
+    test_state = AgentState(
+        file_path="data/test_churn.csv",
+        
+        schema_info="""Dataset Overview:
+- Total Rows: 5
+- Total Columns: 7
+
+Column Details:
+  • customer_id (int64): unique identifier
+  • age (int64): customer age
+  • gender (object): Male/Female
+  • tenure_months (int64): months as customer
+  • monthly_charges (float64): monthly bill amount
+  • total_charges (float64): total amount paid
+  • churn (object): Yes/No - did customer leave""",
+  
+        sample_rows="""| customer_id | age | gender | tenure_months | monthly_charges | churn |
+|-------------|-----|--------|---------------|-----------------|-------|
+| 1           | 34  | Male   | 12            | 65.5            | No    |
+| 2           | 56  | Female | 45            | 89.2            | No    |""",
+
+        user_question="What factors are most associated with customer churn?"
+    )
+    
+    result = asyncio.run(plan_and_code(test_state))
+    print("\n✅ Plan-and-code test complete!")
\ No newline at end of file
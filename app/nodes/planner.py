@@ -5,11 +5,17 @@ Creates step-by-step analysis plans based on dataset schema
 and user questions.
 """
 
-from app.utils.llm import call_llm
-from app.utils.prompts import PLANNER_PROMPT
+import asyncio
+import logging
 
+from app.state import AgentState
+from app.utils.llm import acall_llm, dataset_system
+from app.utils.prompts import PLANNER_SYSTEM_PROMPT, render_planner
 
-def create_analysis_plan(state: dict) -> dict:
+logger = logging.getLogger("datalens.planner")
+
+
+async def create_analysis_plan(state: AgentState) -> dict:
     """
     Create a step-by-step analysis plan.
     
@@ -17,34 +23,34 @@ def create_analysis_plan(state: dict) -> dict:
         state: Current agent state
         
     Returns:
-        Updated state with analysis_plan
+        State update with analysis_plan (only that key, so the node's
+        output can be cached)
     """
     
-    # Fill in the prompt template
-    prompt = PLANNER_PROMPT.format(
-        schema_info=state["schema_info"],
-        sample_rows=state["sample_rows"],
-        user_question=state["user_question"]
+    # The dataset goes in the cached system blocks it shares with the
+    # coder and debugger; only the question is sent uncached
+    system = dataset_system(
+        PLANNER_SYSTEM_PROMPT, state.schema_info, state.sample_rows
     )
+    prompt = render_planner(user_question=state.user_question)
     
     # Call Claude
-    plan = call_llm(prompt, max_tokens=1024)
-    
-    # Update state
-    state["analysis_plan"] = plan
+    plan = await acall_llm(prompt, max_tokens=1024, system=system)
     
-    print("\n" + "=" * 50)
-    print("📋 ANALYSIS PLAN GENERATED:")
-    print("=" * 50)
-    print(plan)
+    logger.debug("📋 ANALYSIS PLAN GENERATED:\n%s", plan)
     
-    return state
+    # Update state
+    return {"analysis_plan": plan}
 
 
 # Test independently
 if __name__ == "__main__":
-    test_state = {
-        "schema_info": """Dataset Overview:
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
+    test_state = AgentState(
+        schema_info="""Dataset Overview:
 - Total Rows: 1,000
 - Total Columns: 7
 
@@ -57,14 +63,14 @@ Column Details:
   • total_charges (float64): samples: [29.99, 1200.00, 5000.00]
   • churn (object): 2 unique values, samples: ['Yes', 'No']""",
         
-        "sample_rows": """| customer_id | age | gender | tenure_months | monthly_charges | churn |
+        sample_rows="""| customer_id | age | gender | tenure_months | monthly_charges | churn |
 |-------------|-----|--------|---------------|-----------------|-------|
 | 1           | 34  | Male   | 12            | 65.5            | No    |
 | 2           | 56  | Female | 45            | 89.2            | No    |
 | 3           | 23  | Male   | 3             | 45.0            | Yes   |""",
         
-        "user_question": "What factors are most associated with customer churn?"
-    }
+        user_question="What factors are most associated with customer churn?"
+    )
     
-    result = create_analysis_plan(test_state)
+    result = asyncio.run(create_analysis_plan(test_state))
     print("\n✅ Planner test complete!")
\ No newline at end of file
@@ -4,55 +4,72 @@ Reporter Node
 Generates human-readable analysis reports from execution results.
 """
 
-from app.utils.llm import call_llm
-from app.utils.prompts import REPORTER_PROMPT
+import asyncio
+import logging
+from typing import Optional
 
+from langchain_core.runnables import RunnableConfig
 
-def generate_report(state: dict) -> dict:
+from app.state import AgentState
+from app.utils.llm import astream_llm, collect, cached_block, token_callback
+from app.utils.prompts import REPORTER_SYSTEM_PROMPT, render_reporter
+from app.utils.text import truncate_middle
+
+# Execution output sent to Claude is cut down to this many characters
+# (start and end kept); every character is input tokens Claude has to read
+# before the report's first token
+MAX_RESULT_CHARS = 4000
+
+logger = logging.getLogger("datalens.reporter")
+
+
+async def generate_report(state: AgentState, config: Optional[RunnableConfig] = None) -> dict:
     """
     Generate a human-readable analysis report.
     
+    The report is streamed to the caller's on_token callback, if there is
+    one, while Claude writes it; the full text is logged at DEBUG level.
+    
     Args:
         state: Current agent state with execution_result
+        config: LangGraph run config (may carry on_token)
         
     Returns:
-        Updated state with final_report
+        State update with final_report
     """
     
-    print("\n" + "=" * 50)
-    print("📝 GENERATING REPORT...")
-    print("=" * 50)
+    logger.debug("📝 GENERATING REPORT...")
     
     # Check if we have results to report on
-    execution_result = state.get("execution_result", "")
-    execution_error = state.get("execution_error", "")
+    execution_result = state.execution_result
+    execution_error = state.execution_error
     
     # If there was an unresolved error, report that
     if execution_error and not execution_result:
-        state["final_report"] = generate_error_report(state)
-        return state
+        return {"final_report": generate_error_report(state)}
     
     # Generate the report using Claude
-    prompt = REPORTER_PROMPT.format(
-        user_question=state.get("user_question", "Analyze this data"),
-        execution_result=execution_result[:8000]  # Limit context size
+    prompt = render_reporter(
+        user_question=state.user_question or "Analyze this data",
+        execution_result=truncate_middle(execution_result, MAX_RESULT_CHARS)
     )
     
-    report = call_llm(prompt, max_tokens=2048)
-    
-    # Store the report
-    state["final_report"] = report
+    report = await collect(
+        astream_llm(
+            prompt,
+            max_tokens=2048,
+            system=[cached_block(REPORTER_SYSTEM_PROMPT)]
+        ),
+        token_callback(config, "reporter")
+    )
     
-    print("\n✅ Report generated successfully!")
-    print("-" * 50)
-    print(report[:1000])
-    if len(report) > 1000:
-        print("... (truncated for display)")
+    logger.debug("✅ Report generated successfully:\n%s", report)
     
-    return state
+    # Store the report
+    return {"final_report": report}
 
 
-def generate_error_report(state: dict) -> str:
+def generate_error_report(state: AgentState) -> str:
     """
     Generate a report explaining that analysis failed.
     
@@ -62,9 +79,9 @@ def generate_error_report(state: dict) -> str:
     Returns:
         Error report string
     """
-    error = state.get("execution_error", "Unknown error")
-    question = state.get("user_question", "your question")
-    attempts = state.get("debug_attempts", 0)
+    error = state.execution_error or "Unknown error"
+    question = state.user_question or "your question"
+    attempts = state.debug_attempts
     
     report = f"""## Analysis Report
 
@@ -85,7 +102,7 @@ Unfortunately, the analysis encountered technical issues that couldn't be automa
 3. **Review column names** - Make sure referenced columns exist
 
 ### What Was Attempted
-{state.get('analysis_plan', 'No plan generated')}
+{state.analysis_plan or 'No plan generated'}
 
 ---
 *This report was generated automatically. Please try again or rephrase your question.*
@@ -96,13 +113,17 @@ Unfortunately, the analysis encountered technical issues that couldn't be automa
 
 # Test independently
 if __name__ == "__main__":
+    # Show the nodes' progress messages
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("datalens").setLevel(logging.DEBUG)
+    
     # Test with successful execution
     print("TEST 1: Successful execution report")
     print("=" * 50)
     
-    test_state = {
-        "user_question": "What factors influence customer churn?",
-        "execution_result": """
+    test_state = AgentState(
+        user_question="What factors influence customer churn?",
+        execution_result="""
 Loading data...
 Data loaded successfully. Shape: (5, 7)
 
@@ -138,11 +159,11 @@ Churned customers have:
 - monthly_charges: -29.40 (lower for churned customers)
 - age: -21.33 (lower for churned customers)
 """,
-        "execution_error": "",
-        "analysis_plan": "1. Check missing values\n2. Calculate churn rates\n3. Identify key factors"
-    }
+        execution_error="",
+        analysis_plan="1. Check missing values\n2. Calculate churn rates\n3. Identify key factors"
+    )
     
-    result = generate_report(test_state)
+    result = asyncio.run(generate_report(test_state))
     print(f"\n\nFull report:\n{result['final_report']}")
     
     # Test with failed execution
@@ -150,13 +171,13 @@ Churned customers have:
     print("TEST 2: Failed execution report")
     print("=" * 50)
     
-    test_state_error = {
-        "user_question": "What factors influence customer churn?",
-        "execution_result": "",
-        "execution_error": "KeyError: 'nonexistent_column'",
-        "analysis_plan": "1. Load data\n2. Analyze columns",
-        "debug_attempts": 3
-    }
+    test_state_error = AgentState(
+        user_question="What factors influence customer churn?",
+        execution_result="",
+        execution_error="KeyError: 'nonexistent_column'",
+        analysis_plan="1. Load data\n2. Analyze columns",
+        debug_attempts=3
+    )
     
-    result = generate_report(test_state_error)
+    result = asyncio.run(generate_report(test_state_error))
     print(f"\n\nError report:\n{result['final_report']}")
\ No newline at end of file
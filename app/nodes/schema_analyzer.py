@@ -5,77 +5,155 @@ Analyzes uploaded CSV files and extracts schema information
 for use in downstream analysis planning.
 """
 
-import pandas as pd
-from tabulate import tabulate
+from app.state import AgentState
+from app.utils.csv_utils import count_csv_rows
+from app.utils.df_cache import df_key
+from app.utils.text import md_table
 
+# Types, unique counts and samples are inferred from this many rows;
+# the executor still gets the full file
+SCHEMA_SAMPLE_ROWS = 10_000
 
-def analyze_schema(state: dict) -> dict:
+# Up to 3 sample values per column are taken from the first rows
+SAMPLE_VALUE_ROWS = 100
+
+
+def analyze_schema(state: AgentState) -> dict:
     """
     Analyze the uploaded CSV file and extract schema information.
     
     Args:
-        state: Current agent state with 'file_path'
+        state: Current agent state with file_path
         
     Returns:
-        Updated state with schema_info, column_types, sample_rows
+        State update with schema_info, column_types, sample_rows, df_key
+        (only these keys, so the node's output can be cached)
     """
     
-    file_path = state["file_path"]
+    file_path = state.file_path
     
-    # Load the CSV
-    df = pd.read_csv(file_path)
+    # The file is scanned once here; nothing below re-reads it
+    schema = _infer_schema_fast(file_path)
+    total = schema["total_rows"]
+    column_info = schema["columns"]
     
-    # --- Extract Column Information ---
-    column_info = []
-    column_types = {}
-    
-    for col in df.columns:
-        dtype = str(df[col].dtype)
-        non_null = df[col].notna().sum()
-        total = len(df)
-        unique = df[col].nunique()
-        
-        # Get sample values (first 3 unique non-null values)
-        sample_values = df[col].dropna().unique()[:3].tolist()
-        
-        column_info.append({
-            "column": col,
-            "dtype": dtype,
-            "non_null": f"{non_null}/{total}",
-            "unique": unique,
-            "samples": sample_values
-        })
-        
-        column_types[col] = dtype
+    column_types = {info["column"]: info["dtype"] for info in column_info}
     
     # --- Create Schema Summary ---
     schema_lines = [
         f"Dataset Overview:",
-        f"- Total Rows: {len(df):,}",
-        f"- Total Columns: {len(df.columns)}",
+        f"- Total Rows: {total:,}",
+        f"- Total Columns: {len(column_info)}",
         f"",
         f"Column Details:",
     ]
     
+    if schema["sampled_rows"] < total:
+        schema_lines.append(
+            f"  (unique counts, ranges, missing counts and samples are "
+            f"from the first {schema['sampled_rows']:,} rows)"
+        )
+    
     for info in column_info:
+        details = [f"{info['unique']} unique values"]
+        if info["min"] is not None:
+            details.append(f"range {info['min']} to {info['max']}")
+        if info["nulls"]:
+            details.append(f"{info['nulls']:,} missing")
+        details.append(f"samples: {info['samples']}")
+        
         schema_lines.append(
-            f"  • {info['column']} ({info['dtype']}): "
-            f"{info['unique']} unique values, "
-            f"samples: {info['samples']}"
+            f"  • {info['column']} ({info['dtype']}): " + ", ".join(details)
         )
     
     schema_info = "\n".join(schema_lines)
     
     # --- Get Sample Rows ---
-    sample_df = df.head(5)
-    sample_rows = tabulate(sample_df, headers='keys', tablefmt='pipe', showindex=False)
+    sample = schema["sample"]
+    sample_rows = md_table(sample.keys(), zip(*sample.values()))
     
     # --- Update State ---
-    state["schema_info"] = schema_info
-    state["column_types"] = column_types
-    state["sample_rows"] = sample_rows
+    return {
+        "schema_info": schema_info,
+        "column_types": column_types,
+        "sample_rows": sample_rows,
+        "df_key": df_key(file_path)
+    }
+
+
+def _infer_schema_fast(file_path: str) -> dict:
+    """
+    Collect the schema of a CSV without loading the whole file.
+    
+    Types, unique and null counts and value ranges come from the first
+    SCHEMA_SAMPLE_ROWS rows, sample values from the first
+    SAMPLE_VALUE_ROWS of those. The rows are read with pd.read_csv, so
+    column names, dtypes and missing values are exactly what the
+    generated code will see in `df`. The total row count comes from a
+    byte-level newline scan, so memory stays bounded no matter how large
+    the file is. The full DataFrame is only parsed when the executor
+    first needs it.
+    
+    Args:
+        file_path: Path to the CSV file
+        
+    Returns:
+        Dict with total_rows, sampled_rows, columns (one dict per column)
+        and sample (first 5 rows as column -> values)
+    """
+    # Imported here so that loading the agent doesn't pay for pandas
+    import pandas as pd
+    
+    df = pd.read_csv(file_path, nrows=SCHEMA_SAMPLE_ROWS)
+    sampled = len(df)
+    
+    # A short file was read completely; no need to scan it again
+    total = sampled if sampled < SCHEMA_SAMPLE_ROWS else count_csv_rows(file_path)
+    
+    # One vectorized pass per statistic over all columns, instead of
+    # several per-column passes
+    null_counts = df.isna().sum()
+    unique_counts = df.nunique()
+    
+    # Value ranges, only where they mean something (numbers); all-missing
+    # columns have none. Per column, since DataFrame.min() would turn
+    # every integer range into floats.
+    minimums, maximums = {}, {}
+    for col, values in df.select_dtypes(include="number").items():
+        if values.notna().any():
+            minimums[col] = values.min()
+            maximums[col] = values.max()
+    
+    # Sample values are informational, so the first rows are enough
+    head = df.head(SAMPLE_VALUE_ROWS)
+    sample_values = [
+        values.dropna().unique()[:3].tolist()
+        for _, values in head.items()
+    ]
+    
+    columns = [
+        {
+            "column": col,
+            "dtype": str(dtype),
+            "nulls": int(null_counts[col]),
+            "unique": int(unique_counts[col]),
+            "min": minimums.get(col),
+            "max": maximums.get(col),
+            "samples": samples
+        }
+        for (col, dtype), samples in zip(df.dtypes.items(), sample_values)
+    ]
     
-    return state
+    # Missing values as None, so they show up as blank table cells
+    sample = df.head(5).astype(object)
+    sample = sample.where(sample.notna(), None)
+    
+    return {
+        "total_rows": total,
+        "sampled_rows": sampled,
+        "columns": columns,
+        "sample": sample.to_dict(orient="list")
+    }
 
 
 # --- Test the node independently ---
@@ -93,10 +171,10 @@ if __name__ == "__main__":
     with open("data/test_churn.csv", "w") as f:
         f.write(test_data)
     
-    test_state = {
-        "file_path": "data/test_churn.csv",
-        "user_question": "What factors influence churn?"
-    }
+    test_state = AgentState(
+        file_path="data/test_churn.csv",
+        user_question="What factors influence churn?"
+    )
     
     result = analyze_schema(test_state)
     
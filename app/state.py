@@ -0,0 +1,55 @@
+"""
+Agent State
+===========
+
+The state that flows through the DataLens AI graph.
+"""
+
+from dataclasses import dataclass, field, asdict
+
+
+@dataclass(slots=True, kw_only=True)
+class AgentState:
+    """
+    The state that flows through our agent graph.
+    
+    Think of this as a "baton" in a relay race that accumulates
+    information as it passes through each node.
+    
+    Nodes read fields as attributes (state.schema_info) and return a
+    dict with only the fields they change; LangGraph merges it into the
+    next state. Slots keep per-run copies small and attribute access
+    cheap. The graph's final result is a plain dict.
+    """
+    
+    # Input
+    file_path: str = ""              # Path to the uploaded CSV
+    user_question: str = ""          # What the user wants to know
+    
+    # Schema analysis output
+    schema_info: str = ""            # Structured description of the data
+    column_types: dict = field(default_factory=dict)  # Column name -> data type mapping
+    sample_rows: str = ""            # String representation of sample data
+    df_key: tuple = ()               # Key of the parsed DataFrame in df_cache
+    
+    # Planning output
+    analysis_plan: str = ""          # Step-by-step plan in natural language
+    
+    # Code generation output
+    generated_code: str = ""         # Python code to execute
+    
+    # Execution output
+    execution_result: str = ""       # Output from running the code
+    execution_error: str = ""        # Error message if execution failed
+    figure_json: str = ""            # Plotly figure as JSON (if visualization)
+    
+    # Debugging
+    debug_attempts: int = 0          # Number of debug attempts (max 3)
+    debug_executed: bool = False     # Debugger already ran its fix (speculative mode)
+    
+    # Final output
+    final_report: str = ""           # Human-readable analysis report
+    
+    def to_dict(self) -> dict:
+        """Plain-dict copy of the state (e.g. for JSON serialization)."""
+        return asdict(self)
\ No newline at end of file
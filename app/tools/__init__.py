@@ -1 +1 @@
-from app.tools.code_executor import execute_code, execute_code_safely
\ No newline at end of file
+from app.tools.code_executor import execute_code, execute_code_safely, aexecute_code_safely, prewarm_worker, BoundedWriter
\ No newline at end of file
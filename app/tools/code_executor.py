@@ -5,23 +5,223 @@ Safely executes Python code and captures output, errors,
 and Plotly figures.
 """
 
+import os
+import re
 import sys
 import io
+import json
+import atexit
+import asyncio
+import logging
+import threading
 import traceback
-from typing import Tuple, Optional
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Tuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger("datalens.executor")
+
+# Set EXECUTOR_WORKER=0 to run generated code in this process instead
+USE_WORKER = os.getenv("EXECUTOR_WORKER", "1") != "0"
+
+# Directory containing the `app` package, so the worker can import it
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Captured output beyond this many characters is dropped
+MAX_OUTPUT_CHARS = int(os.getenv("MAX_OUTPUT_CHARS", str(16 * 1024)))
 
-def execute_code(code: str) -> Tuple[str, str, Optional[str]]:
+# Optional cap on a worker's address space in MB (0 = no limit); code that
+# goes over it gets a MemoryError instead of exhausting the machine
+WORKER_MEMORY_MB = int(os.getenv("EXECUTOR_MEMORY_MB", "0"))
+
+# How much longer than its timeout a worker gets to stop on its own
+# before it is killed
+KILL_GRACE_SECONDS = 5
+
+
+class BoundedWriter(io.TextIOBase):
+    """
+    A stdout replacement that keeps at most max_chars characters.
+    
+    Generated code sometimes prints whole DataFrames; only the first and
+    the last max_chars // 2 characters are stored, so memory stays
+    bounded and the reporter isn't sent megabytes of output, yet the
+    final numbers (and any trailing warnings) printed at the end survive.
+    getvalue() has a marker where the middle was cut, like
+    truncate_middle's.
+    """
+    
+    def __init__(self, max_chars: int = MAX_OUTPUT_CHARS):
+        super().__init__()
+        self._head_chars = max_chars // 2
+        self._tail_chars = max_chars - self._head_chars
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._dropped = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, text: str) -> int:
+        written = len(text)
+        
+        room = self._head_chars - self._head_size
+        if room > 0:
+            self._head.append(text[:room])
+            self._head_size += min(room, written)
+            text = text[room:]
+        
+        if text:
+            # Only the last _tail_chars characters can end up in the tail
+            if len(text) > self._tail_chars:
+                self._dropped += len(text) - self._tail_chars
+                text = text[-self._tail_chars:]
+            self._tail.append(text)
+            self._tail_size += len(text)
+            
+            # Forget whole pieces that are no longer needed to fill it
+            while self._tail_size - len(self._tail[0]) >= self._tail_chars:
+                piece = self._tail.popleft()
+                self._tail_size -= len(piece)
+                self._dropped += len(piece)
+        
+        return written
+    
+    def getvalue(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        dropped = self._dropped + max(len(tail) - self._tail_chars, 0)
+        if not dropped:
+            return head + tail
+        return (
+            head
+            + f"\n... [output truncated: {dropped:,} characters omitted] ...\n"
+            + tail[-self._tail_chars:]
+        )
+
+
+class _ThreadRoutedStream:
+    """
+    Stand-in for sys.stdout/sys.stderr that can be redirected per thread.
+    
+    Swapping sys.stdout itself (as contextlib.redirect_stdout does) is
+    process-wide, so two runs on different threads would capture each
+    other's prints - or restore the wrong stream when they finish. Writes
+    go to the stream set for the current thread, otherwise to the
+    original one.
+    """
+    
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+    
+    def _target(self):
+        return getattr(self._local, "stream", None) or self._default
+    
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+    
+    def flush(self) -> None:
+        self._target().flush()
+    
+    def __getattr__(self, name):
+        # encoding, fileno, isatty, ... of the original stream
+        return getattr(self._default, name)
+
+
+_routing_lock = threading.Lock()
+
+
+def _routed(name: str) -> _ThreadRoutedStream:
+    """Return sys.<name>, replacing it with a _ThreadRoutedStream first if needed."""
+    with _routing_lock:
+        stream = getattr(sys, name)
+        if not isinstance(stream, _ThreadRoutedStream):
+            stream = _ThreadRoutedStream(stream)
+            setattr(sys, name, stream)
+        return stream
+
+
+@contextmanager
+def _capture_output(writer):
+    """Send this thread's stdout and stderr (e.g. warnings) to writer."""
+    streams = [_routed("stdout"), _routed("stderr")]
+    previous = [getattr(stream._local, "stream", None) for stream in streams]
+    
+    for stream in streams:
+        stream._local.stream = writer
+    try:
+        yield
+    finally:
+        for stream, old in zip(streams, previous):
+            stream._local.stream = old
+
+
+def _base_namespace() -> dict:
+    """
+    Common imports pre-loaded for generated code.
+    
+    pandas/numpy/plotly are imported on first use rather than with this
+    module, so importing the agent stays fast; the worker calls this at
+    startup so its first run doesn't pay for them either.
+    """
+    import pandas as pd
+    import numpy as np
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
+    return {
+        "pd": pd,
+        "np": np,
+        "px": px,
+        "go": go,
+        "make_subplots": make_subplots,
+        "__builtins__": __builtins__,
+    }
+
+
+def _format_error(error: Exception, code: str) -> str:
+    """
+    Traceback for an error in generated code, showing only that code's frames.
+    
+    format_exc() also lists this module's exec() frame and every pandas or
+    plotly internal the error passed through. That is noise for the
+    debugger, which can only change the generated code. Its frames come
+    from "<string>"; their source lines are filled in from the code, which
+    linecache can't find.
+    """
+    tb = traceback.TracebackException.from_exception(error)
+    lines = code.splitlines()
+    
+    frames = [
+        traceback.FrameSummary(
+            frame.filename, frame.lineno, frame.name,
+            line=lines[frame.lineno - 1] if 0 < (frame.lineno or 0) <= len(lines) else ""
+        )
+        for frame in tb.stack
+        if frame.filename == "<string>"
+    ]
+    
+    parts = ["Traceback (most recent call last):\n"] if frames else []
+    parts.extend(traceback.StackSummary.from_list(frames).format())
+    parts.extend(tb.format_exception_only())
+    return "".join(parts)
+
+
+def execute_code(code: str, df: Optional["pd.DataFrame"] = None) -> Tuple[str, str, Optional[str]]:
     """
     Execute Python code and capture results.
     
     Args:
         code: Python code string to execute
+        df: Optional DataFrame made available to the code as `df`
         
     Returns:
         Tuple of (output, error, figure_json)
@@ -30,41 +230,33 @@ def execute_code(code: str) -> Tuple[str, str, Optional[str]]:
         - figure_json: Plotly figure as JSON string, None if no figure
     """
     
-    # Capture stdout
-    old_stdout = sys.stdout
-    sys.stdout = captured_output = io.StringIO()
+    # Capture what the code prints (stdout and stderr), on this thread only
+    captured_output = BoundedWriter()
     
     # Variables to store results
     error_message = ""
     figure_json = None
     
     # Create execution namespace with common imports pre-loaded
-    exec_namespace = {
-        "pd": pd,
-        "np": np,
-        "px": px,
-        "go": go,
-        "make_subplots": make_subplots,
-        "__builtins__": __builtins__,
-    }
+    exec_namespace = _base_namespace()
+    
+    if df is not None:
+        exec_namespace["df"] = df
     
     try:
-        # Execute the code
-        exec(code, exec_namespace)
-        
-        # Check if a figure was created
-        if "fig" in exec_namespace:
-            fig = exec_namespace["fig"]
-            if hasattr(fig, "to_json"):
-                figure_json = fig.to_json()
+        with _capture_output(captured_output):
+            # Execute the code
+            exec(code, exec_namespace)
+            
+            # Check if a figure was created
+            if "fig" in exec_namespace:
+                fig = exec_namespace["fig"]
+                if hasattr(fig, "to_json"):
+                    figure_json = fig.to_json()
                 
     except Exception as e:
-        # Capture the full traceback
-        error_message = traceback.format_exc()
-        
-    finally:
-        # Restore stdout
-        sys.stdout = old_stdout
+        # Capture the traceback (generated code's frames + the error)
+        error_message = _format_error(e, code)
     
     # Get captured output
     output = captured_output.getvalue()
@@ -72,43 +264,268 @@ def execute_code(code: str) -> Tuple[str, str, Optional[str]]:
     return output, error_message, figure_json
 
 
-def execute_code_safely(code: str, timeout_seconds: int = 30) -> Tuple[str, str, Optional[str]]:
+class ExecutorWorker:
+    """
+    A persistent `python -m app.tools.worker` child process.
+    
+    The worker keeps pandas/numpy/plotly imported and parsed DataFrames
+    cached between runs, so retries don't pay for either again. It also
+    keeps a crash in generated code from taking down this process.
+    """
+    
+    def __init__(self):
+        # Same working directory as us (generated code may use relative
+        # paths), with the project on the path so `app` is importable
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in [_PROJECT_ROOT, env.get("PYTHONPATH")] if p
+        )
+        
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "-m", "app.tools.worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True,
+            encoding="utf-8"
+        )
+    
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+    
+    def run(self, code: str, df_key: Optional[tuple] = None,
+            timeout: Optional[float] = None) -> Tuple[str, str, Optional[str]]:
+        """
+        Send code to the worker and wait for its reply.
+        
+        The worker stops code that runs longer than timeout seconds
+        itself (the code gets a TimeoutError). If it still hasn't replied
+        KILL_GRACE_SECONDS later - the code swallowed the error, or is
+        stuck in C code - it is killed and TimeoutError is raised here.
+        """
+        request = {
+            "code": code,
+            "df_key": list(df_key) if df_key else None,
+            "timeout": timeout
+        }
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        
+        timed_out = threading.Event()
+        timer = None
+        if timeout:
+            def kill():
+                timed_out.set()
+                self.process.kill()
+            
+            timer = threading.Timer(timeout + KILL_GRACE_SECONDS, kill)
+            timer.daemon = True
+            timer.start()
+        
+        try:
+            line = self.process.stdout.readline()
+        finally:
+            if timer is not None:
+                timer.cancel()
+        
+        if not line:
+            if timed_out.is_set():
+                raise TimeoutError(f"code did not finish within {timeout} seconds")
+            raise RuntimeError(f"executor worker exited with code {self.process.wait()}")
+        
+        reply = json.loads(line)
+        return reply["output"], reply["error"], reply["figure_json"]
+    
+    def kill(self) -> None:
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+
+
+# Worker pool. Usually a single worker is enough; concurrent runs
+# (several analyses, speculative debugging) each start another one, and
+# up to MAX_IDLE_WORKERS of them are kept around afterwards.
+MAX_IDLE_WORKERS = 2
+
+_workers = []           # every live worker, for shutdown
+_idle_workers = []
+_workers_lock = threading.Lock()
+
+
+def _shutdown_workers():
+    for worker in _workers:
+        worker.kill()
+
+
+atexit.register(_shutdown_workers)
+
+
+def _checkout_worker() -> ExecutorWorker:
+    """Take an idle worker from the pool, or start a new one."""
+    with _workers_lock:
+        while _idle_workers:
+            worker = _idle_workers.pop()
+            if worker.is_alive():
+                return worker
+            _workers.remove(worker)
+        
+        worker = ExecutorWorker()
+        _workers.append(worker)
+        return worker
+
+
+def _return_worker(worker: ExecutorWorker, broken: bool = False) -> None:
+    """Put a worker back in the pool, or stop it if it's broken or not needed."""
+    with _workers_lock:
+        if not broken and len(_idle_workers) < MAX_IDLE_WORKERS:
+            _idle_workers.append(worker)
+            return
+        _workers.remove(worker)
+    worker.kill()
+
+
+def prewarm_worker() -> None:
+    """
+    Get code execution ready before the first analysis needs it.
+    
+    Starts an idle worker, which imports pandas/numpy/plotly in its own
+    process while this one carries on (or, with EXECUTOR_WORKER=0, does
+    those imports here).
+    """
+    if not USE_WORKER:
+        _base_namespace()
+        return
+    _return_worker(_checkout_worker())
+
+
+def run_in_worker(code: str, df_key: Optional[tuple] = None,
+                  timeout: Optional[float] = None) -> Tuple[str, str, Optional[str]]:
+    """
+    Execute code in a pooled worker process, starting one if needed.
+    
+    A worker is only replaced after a hard failure (it died, the pipe
+    broke, or it had to be killed for running past its timeout); errors
+    raised by the code itself are returned as usual.
+    Safe to call from several threads at once.
+    """
+    worker = _checkout_worker()
+    
+    try:
+        result = worker.run(code, df_key, timeout)
+    except TimeoutError as e:
+        _return_worker(worker, broken=True)
+        return "", f"Execution timed out: {e}", None
+    except (OSError, ValueError, RuntimeError) as e:
+        _return_worker(worker, broken=True)
+        return "", f"Execution crashed the worker process: {e}", None
+    
+    _return_worker(worker)
+    return result
+
+
+# Imports of os/subprocess/sys, and calls to the builtins that can run or
+# read arbitrary things - as whole words, so methods like df.eval() or
+# names like reopen() don't match. One pass over the code finds them all.
+_DANGEROUS_PATTERN = re.compile(
+    r"\b(?:import|from)\s+(?:os|subprocess|sys)\b"
+    r"|(?<![\w.])(?:__import__|eval|exec|open)\s*\("
+)
+
+
+def _flag_dangerous_patterns(code: str) -> None:
+    """Log a warning for each suspicious pattern in the code."""
+    found = dict.fromkeys(
+        " ".join(match.group().split()).replace(" (", "(")
+        for match in _DANGEROUS_PATTERN.finditer(code)
+    )
+    
+    # Note: We're not blocking these, just flagging for awareness
+    # A production system would reject code with these patterns
+    for pattern in found:
+        logger.warning("Code contains potentially dangerous pattern: %s", pattern)
+
+
+def execute_code_safely(code: str, timeout_seconds: int = 30,
+                        df_key: Optional[tuple] = None) -> Tuple[str, str, Optional[str]]:
     """
     Execute code with additional safety measures.
     
-    For portfolio purposes, this is a simple wrapper.
+    The code runs in a separate, long-lived worker process (see
+    ExecutorWorker; concurrent calls use separate workers), so a crash
+    or runaway memory use in generated code can't take down the app.
+    The worker enforces timeout_seconds and, if EXECUTOR_MEMORY_MB is
+    set, a memory limit.
+    
+    For portfolio purposes, this is otherwise a simple wrapper.
     In production, you'd add:
-    - Timeout enforcement
-    - Memory limits
     - Sandboxed execution (Docker/E2B)
     - Blocked imports (os, subprocess, etc.)
     
     Args:
         code: Python code to execute
-        timeout_seconds: Max execution time (not enforced in this version)
+        timeout_seconds: Max execution time (only enforced when the code
+            runs in a worker)
+        df_key: Optional df_cache key; that DataFrame is available to the
+            code as `df`
         
     Returns:
         Tuple of (output, error, figure_json)
     """
     
     # Basic code validation
-    dangerous_patterns = [
-        "import os",
-        "import subprocess",
-        "import sys",
-        "open(",
-        "__import__",
-        "eval(",
-        "exec(",
-    ]
+    _flag_dangerous_patterns(code)
     
-    # Note: We're not blocking these, just flagging for awareness
-    # A production system would reject code with these patterns
-    for pattern in dangerous_patterns:
-        if pattern in code:
-            print(f"Warning: Code contains potentially dangerous pattern: {pattern}")
+    if USE_WORKER:
+        return run_in_worker(code, df_key, timeout_seconds)
+    
+    df = None
+    if df_key:
+        from app.utils.df_cache import get_dataframe
+        df = get_dataframe(tuple(df_key)).copy()
+    return execute_code(code, df=df)
+
+
+async def aexecute_code_safely(code: str, timeout_seconds: int = 30,
+                               df_key: Optional[tuple] = None) -> Tuple[str, str, Optional[str]]:
+    """
+    Async version of execute_code_safely that can be cancelled.
+    
+    Cancelling the awaiting task kills the worker running the code (the
+    pool starts a fresh one when needed), so abandoned code - e.g. a
+    losing speculative debug candidate - stops right away instead of
+    running to completion.
+    
+    Args:
+        code: Python code to execute
+        timeout_seconds: Max execution time (only enforced when the code
+            runs in a worker)
+        df_key: Optional df_cache key; that DataFrame is available to the
+            code as `df`
+        
+    Returns:
+        Tuple of (output, error, figure_json)
+    """
+    if not USE_WORKER:
+        return await asyncio.to_thread(execute_code_safely, code, timeout_seconds, df_key)
+    
+    _flag_dangerous_patterns(code)
+    worker = _checkout_worker()
+    
+    try:
+        result = await asyncio.to_thread(worker.run, code, df_key, timeout_seconds)
+    except asyncio.CancelledError:
+        # Unblocks the thread waiting on the worker's reply
+        _return_worker(worker, broken=True)
+        raise
+    except TimeoutError as e:
+        _return_worker(worker, broken=True)
+        return "", f"Execution timed out: {e}", None
+    except (OSError, ValueError, RuntimeError) as e:
+        _return_worker(worker, broken=True)
+        return "", f"Execution crashed the worker process: {e}", None
     
-    return execute_code(code)
+    _return_worker(worker)
+    return result
 
 
 # Test the executor
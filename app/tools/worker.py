@@ -0,0 +1,103 @@
+"""
+Executor Worker
+
+Long-lived child process that runs generated code for
+execute_code_safely.
+
+pandas, numpy and plotly are imported once when the worker starts, and
+parsed DataFrames stay in its df_cache (including ones the code reads
+itself with pd.read_csv), so debug retries skip both the import and the
+CSV parse.
+
+Code that runs past the request's timeout gets a TimeoutError; with
+EXECUTOR_MEMORY_MB set, the worker's memory is capped as well.
+
+Protocol: one JSON object per line.
+  request (stdin):  {"code": "...", "df_key": [path, mtime] or null,
+                     "timeout": seconds or null}
+  reply (stdout):   {"output": "...", "error": "...", "figure_json": "..." or null}
+
+Run with: python -m app.tools.worker
+"""
+
+import os
+import sys
+import json
+import signal
+import traceback
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from app.tools.code_executor import WORKER_MEMORY_MB, _base_namespace, execute_code
+from app.utils.df_cache import get_dataframe, memoize_read_csv
+
+
+@contextmanager
+def _time_limit(seconds):
+    """Raise TimeoutError in the block after `seconds` (no-op without SIGALRM)."""
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+    
+    def on_alarm(signum, frame):
+        raise TimeoutError(f"code took longer than {seconds} seconds")
+    
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def main():
+    # Replies go out on a private copy of stdout; fd 1 is pointed at
+    # stderr so stray writes from generated code can't corrupt them
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    # Pay for the pandas/numpy/plotly imports before the first request
+    _base_namespace()
+    memoize_read_csv()
+    
+    if WORKER_MEMORY_MB and resource is not None:
+        limit = WORKER_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        
+        request = json.loads(line)
+        
+        # Each run gets its own copy; generated code often modifies df
+        df = None
+        try:
+            if request.get("df_key"):
+                df = get_dataframe(tuple(request["df_key"])).copy()
+        except Exception:
+            output, error, figure_json = "", traceback.format_exc(), None
+        else:
+            # Only the code itself is timed, not loading the DataFrame
+            try:
+                with _time_limit(request.get("timeout")):
+                    output, error, figure_json = execute_code(request["code"], df=df)
+            except TimeoutError:
+                # Fired just outside execute_code's own error handling
+                output, error, figure_json = "", traceback.format_exc(), None
+        
+        replies.write(json.dumps({
+            "output": output,
+            "error": error,
+            "figure_json": figure_json
+        }) + "\n")
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,7 +1,47 @@
-from app.utils.prompts import (
-    PLANNER_PROMPT,
-    CODER_PROMPT,
-    DEBUGGER_PROMPT,
-    REPORTER_PROMPT
-)
-from app.utils.llm import get_llm, call_llm
\ No newline at end of file
+import importlib
+
+# Imported on first access, so e.g. `from app.utils.text import ...` or the
+# prompt templates don't load the Anthropic SDK along with llm.py.
+_EXPORTS = {
+    "PLANNER_SYSTEM_PROMPT": "prompts",
+    "PLANNER_PROMPT": "prompts",
+    "DATASET_PROMPT": "prompts",
+    "CODER_SYSTEM_PROMPT": "prompts",
+    "CODER_PROMPT": "prompts",
+    "PLAN_AND_CODE_SYSTEM_PROMPT": "prompts",
+    "PLAN_AND_CODE_PROMPT": "prompts",
+    "DEBUGGER_SYSTEM_PROMPT": "prompts",
+    "DEBUGGER_PROMPT": "prompts",
+    "REPORTER_SYSTEM_PROMPT": "prompts",
+    "REPORTER_PROMPT": "prompts",
+    "PromptTemplate": "prompts",
+    "render_planner": "prompts",
+    "render_dataset": "prompts",
+    "render_coder": "prompts",
+    "render_plan_and_code": "prompts",
+    "render_debugger": "prompts",
+    "render_reporter": "prompts",
+    "strip_markdown_fence": "text",
+    "md_table": "text",
+    "truncate_middle": "text",
+    "get_llm": "llm",
+    "call_llm": "llm",
+    "acall_llm": "llm",
+    "acall_llm_tool": "llm",
+    "astream_llm": "llm",
+    "collect": "llm",
+    "awarm_prompt_cache": "llm",
+    "cached_block": "llm",
+    "dataset_system": "llm",
+    "token_callback": "llm",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
\ No newline at end of file
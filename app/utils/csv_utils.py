@@ -0,0 +1,61 @@
+"""
+CSV Utilities
+=============
+
+Cheap questions about CSV files that don't need a full parse.
+"""
+
+# Read size for byte-level scans
+_BLOCK_SIZE = 1 << 20
+
+
+def count_csv_rows(file_path: str) -> int:
+    """
+    Count the data rows in a CSV file without parsing it.
+    
+    Counts newline bytes in 1 MiB blocks (memory stays constant) and
+    subtracts the header line. Quoted fields that contain newlines are
+    counted as extra rows, and so are blank lines between rows; blank
+    lines at the end of the file are not counted, as with pd.read_csv.
+    
+    The blocks are read straight into one reusable buffer, skipping
+    Python's file buffering, and bytearray.count scans each in C. This
+    beats a memchr/find loop over an mmap, which runs a Python-level
+    iteration per row.
+    
+    Args:
+        file_path: Path to the CSV file
+        
+    Returns:
+        Number of rows after the header
+    """
+    buffer = bytearray(_BLOCK_SIZE)
+    newlines = 0
+    # Newlines after the last non-blank byte so far
+    trailing = 0
+    has_content = False
+    
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            newlines += buffer.count(b"\n", 0, size)
+            
+            # Only steps over the block's trailing line breaks
+            end = size
+            while end and buffer[end - 1] in b"\r\n":
+                end -= 1
+            if end:
+                has_content = True
+                trailing = buffer.count(b"\n", end, size)
+            else:
+                trailing += buffer.count(b"\n", 0, size)
+    
+    if not has_content:
+        return 0
+    
+    # The content has one more line than it has newlines (the last row
+    # ends at the trailing run, or at the end of the file), and the
+    # first line is the header
+    return newlines - trailing
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+DataFrame Cache
+===============
+
+Parses each uploaded CSV once per process.
+
+The schema analyzer and every execution attempt (including debug
+retries) need the same DataFrame, so it is kept in memory keyed on the
+file's path and modification time. Rewriting the file changes the key,
+which makes the next lookup re-read it.
+
+Files are parsed with Arrow's multithreaded CSV reader when pyarrow is
+installed (it comes with Streamlit), falling back to pandas' own reader.
+"""
+
+import os
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The real pd.read_csv, once memoize_read_csv() has replaced it
+_pandas_read_csv = None
+
+# pd.read_csv's default na_values; Arrow's own list lacks "None" and "<NA>"
+_PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null"
+]
+
+
+def _read_csv_arrow(file_path: str) -> "pd.DataFrame":
+    """
+    Parse a CSV with pyarrow, typed the way pd.read_csv would type it.
+    
+    pandas' engine="pyarrow" turns date and time columns into datetime64
+    or date objects, while its default reader (and the schema the LLM is
+    shown) leaves them as text. Arrow infers the column types from the
+    first block, so those types are looked at first and any temporal
+    columns read as strings. Missing values are recognized by pandas'
+    default list.
+    
+    Raises:
+        ImportError: pyarrow is not installed
+        ValueError: Arrow can't parse the file like pandas would
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    
+    convert_options = pv.ConvertOptions(
+        null_values=_PANDAS_NA_VALUES,
+        strings_can_be_null=True
+    )
+    with pv.open_csv(file_path, convert_options=convert_options) as reader:
+        inferred = reader.schema
+    
+    # pandas renames duplicate headers ("a", "a.1") and names empty ones
+    # ("Unnamed: 0", e.g. the index column of df.to_csv()); Arrow doesn't
+    if len(set(inferred.names)) != len(inferred.names):
+        raise ValueError("duplicate column names")
+    if "" in inferred.names:
+        raise ValueError("empty column name")
+    
+    convert_options.column_types = {
+        field.name: pa.string()
+        for field in inferred
+        if pa.types.is_temporal(field.type)
+    }
+    table = pv.read_csv(file_path, convert_options=convert_options)
+    
+    # An all-missing column is float64 NaN in pandas, but Arrow's null
+    # type would come out as object None
+    if any(pa.types.is_null(field.type) for field in table.schema):
+        raise ValueError("column without values")
+    
+    df = table.to_pandas()
+    
+    # Missing values in object columns (booleans, and strings before
+    # pandas 3) come out as None; pandas' reader gives NaN
+    for name, column in zip(table.column_names, table.columns):
+        if column.null_count and df[name].dtype == object:
+            df[name] = df[name].where(df[name].notna(), float("nan"))
+    return df
+
+
+@lru_cache(maxsize=4)
+def _read_csv(file_path: str, mtime: float) -> "pd.DataFrame":
+    # mtime is only part of the cache key. pandas is imported here so
+    # that importing this module (e.g. for df_key) stays cheap.
+    import pandas as pd
+    
+    try:
+        return _read_csv_arrow(file_path)
+    except (ImportError, ValueError):
+        # No pyarrow, or e.g. a value that doesn't fit the type Arrow
+        # inferred from the first block
+        return (_pandas_read_csv or pd.read_csv)(file_path)
+
+
+def df_key(file_path: str) -> tuple:
+    """Cache key for a CSV file: (absolute path, modification time)."""
+    return (os.path.abspath(file_path), os.path.getmtime(file_path))
+
+
+def get_dataframe(key: tuple) -> "pd.DataFrame":
+    """
+    Return the parsed DataFrame for a key from df_key().
+    
+    The returned frame is shared; copy it before handing it to code
+    that might modify it.
+    """
+    return _read_csv(*key)
+
+
+def load_csv(file_path: str) -> "pd.DataFrame":
+    """Read a CSV file, reusing the parsed DataFrame if it hasn't changed."""
+    return get_dataframe(df_key(file_path))
+
+
+def memoize_read_csv() -> None:
+    """
+    Route plain pd.read_csv(path) calls through this cache.
+    
+    Meant for the executor worker: generated code (debug fixes in
+    particular) sometimes reads the CSV again instead of using `df`,
+    which would re-parse it on every attempt. Calls with just a file
+    path get a copy of the cached frame; anything else goes straight
+    to pandas.
+    """
+    global _pandas_read_csv
+    import pandas as pd
+    
+    if _pandas_read_csv is not None:
+        return
+    _pandas_read_csv = original = pd.read_csv
+    
+    @wraps(original)
+    def read_csv(filepath_or_buffer, *args, **kwargs):
+        if (args or kwargs
+                or not isinstance(filepath_or_buffer, (str, os.PathLike))
+                or not os.path.isfile(filepath_or_buffer)):
+            return original(filepath_or_buffer, *args, **kwargs)
+        return load_csv(os.fspath(filepath_or_buffer)).copy()
+    
+    pd.read_csv = read_csv
+
+
+# --- Check the Arrow reader against pandas ---
+if __name__ == "__main__":
+    import tempfile
+    import pandas as pd
+    
+    cases = {
+        "plain": "a,b,c\n1,x,1.5\n2,y,\n3,z,2.5\n",
+        "index column": pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}).to_csv(),
+        "duplicate headers": "a,a\n1,2\n3,4\n",
+        "empty column": "a,b\n1,\n2,\n",
+        "missing values": "x,y\n1,a\n1e3,None\nN/A,<NA>\n",
+        "missing booleans and strings": "a,b,c\n1,x,True\n2,,\n3,z,False\n",
+        "padded numbers": "b\n 2\n 4\n",
+        "dates": "d\n2024-01-01\n2024-01-02\n",
+    }
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for number, (name, text) in enumerate(cases.items()):
+            # A new file per case, so no two share a _read_csv cache key
+            path = os.path.join(directory, f"case_{number}.csv")
+            with open(path, "w") as f:
+                f.write(text)
+            
+            try:
+                _read_csv_arrow(path)
+                reader = "arrow"
+            except ValueError:
+                reader = "pandas"
+            
+            got, expected = load_csv(path), pd.read_csv(path)
+            pd.testing.assert_frame_equal(got, expected)
+            
+            # assert_frame_equal treats None and NaN as equal; the
+            # generated code may not
+            for column in expected:
+                assert list(map(type, got[column])) == list(map(type, expected[column])), column
+            print(f"✅ {name} ({reader})")
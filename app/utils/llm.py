@@ -6,40 +6,305 @@ Centralized Claude interaction for consistency.
 """
 
 import os
+import json
+import asyncio
+import weakref
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Optional
 from dotenv import load_dotenv
-from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from app.utils.llm_cache import CACHE_ENABLED, cached, get_cache, parse_ttl
+from app.utils.prompts import render_dataset
 
 load_dotenv()
 
+MODEL = "claude-sonnet-4-20250514"
+
+# How long Claude responses stay in the response cache
+_CACHE_TTL = parse_ttl("7d")
+
+
+def _deterministic(arguments: dict) -> bool:
+    # Only responses at temperature 0 are cached: a sampled one (say, code
+    # that then failed to run) would otherwise be replayed for a week
+    return arguments.get("temperature") == 0
+
+# Max number of Claude requests in flight at once (per event loop)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+# asyncio.Semaphore is bound to the loop it is first used on, and both the
+# CLI and Streamlit start a fresh loop per analysis via asyncio.run().
+_SEMAPHORES = weakref.WeakKeyDictionary()
 
-def get_llm(max_tokens: int = 4096):
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Return the concurrency guard for the running event loop."""
+    loop = asyncio.get_running_loop()
+    sem = _SEMAPHORES.get(loop)
+    if sem is None:
+        sem = _SEMAPHORES[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return sem
+
+
+def cached_block(text: str) -> dict:
+    """
+    Build a system prompt block marked for Anthropic prompt caching.
+    
+    Everything up to and including this block is cached by Claude, so
+    repeated calls that start with identical blocks are billed at the
+    cached-token rate and return their first token sooner.
+    """
+    return {
+        "type": "text",
+        "text": text,
+        "cache_control": {"type": "ephemeral"}
+    }
+
+
+@lru_cache(maxsize=8)
+def _dataset_text(schema_info: str, sample_rows: str) -> str:
+    # Rendered once per dataset: the planner, coder warmup, coder and
+    # every debug attempt all send the same block
+    return render_dataset(schema_info=schema_info, sample_rows=sample_rows)
+
+
+def dataset_system(instructions: str, schema_info: str, sample_rows: str) -> list:
+    """
+    System blocks for a node that works on the dataset.
+    
+    The dataset description comes first and the node's instructions
+    second. Claude caches prompt prefixes, so every node on the same
+    dataset reads the first block from one cache entry, and only its own
+    instructions are written separately.
+    
+    Args:
+        instructions: The node's fixed system prompt
+        schema_info: Schema summary from the schema analyzer
+        sample_rows: Sample rows table from the schema analyzer
+        
+    Returns:
+        System prompt blocks for acall_llm / astream_llm
+    """
+    return [
+        cached_block(_dataset_text(schema_info, sample_rows)),
+        cached_block(instructions)
+    ]
+
+
+def _build_messages(prompt: str, system: Optional[list] = None):
+    """Put the system blocks (if any) ahead of the user prompt."""
+    if not system:
+        return prompt
+    return [SystemMessage(content=system), HumanMessage(content=prompt)]
+
+
+def _chunk_text(chunk) -> str:
+    """Extract the text from a streamed message chunk."""
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(
+        block.get("text", "") for block in chunk.content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+def token_callback(config: Optional[dict], node: str) -> Callable[[str], None]:
+    """
+    Get the function a node should feed streamed text to.
+    
+    Callers pass on_token(node, text) in the graph config, e.g.
+    agent.ainvoke(state, {"configurable": {"on_token": show}}).
+    Without one, streamed text is dropped (nodes log the full text at
+    DEBUG level once it is complete).
+    """
+    on_token = ((config or {}).get("configurable") or {}).get("on_token")
+    if on_token is None:
+        return lambda text: None
+    return lambda text: on_token(node, text)
+
+
+@lru_cache(maxsize=8)
+def get_llm(max_tokens: int = 4096, temperature: Optional[float] = None):
     """
     Get a configured Claude instance.
     
+    Instances are cached per (max_tokens, temperature) and shared by all
+    callers; ChatAnthropic is safe to call from several threads and event
+    loops at once, and reusing it keeps the Anthropic client it builds
+    (and that client's pooled connections) alive between calls.
+    
     Args:
         max_tokens: Maximum tokens in response
+        temperature: Sampling temperature (None for the API default)
         
     Returns:
         Configured ChatAnthropic instance
     """
+    # Imported here: the Anthropic SDK takes most of a second to load
+    from langchain_anthropic import ChatAnthropic
+    
     return ChatAnthropic(
-        model="claude-sonnet-4-20250514",
+        model=MODEL,
         api_key=os.getenv("ANTHROPIC_API_KEY"),
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        temperature=temperature
     )
 
 
-def call_llm(prompt: str, max_tokens: int = 4096) -> str:
+@cached(ttl=_CACHE_TTL, namespace=MODEL, condition=_deterministic)
+def call_llm(prompt: str, max_tokens: int = 4096,
+             system: Optional[list] = None,
+             temperature: Optional[float] = 0.0) -> str:
     """
     Make a simple call to Claude.
     
+    Responses at temperature 0 are cached on disk for 7 days (see
+    llm_cache); set LLM_CACHE=0 to disable.
+    
     Args:
         prompt: The prompt to send
         max_tokens: Maximum tokens in response
+        system: Optional system prompt blocks (see cached_block)
+        temperature: Sampling temperature (None for the API default);
+            other values than 0 are never cached
         
     Returns:
         Claude's response as a string
     """
-    llm = get_llm(max_tokens)
-    response = llm.invoke(prompt)
-    return response.content
\ No newline at end of file
+    llm = get_llm(max_tokens, temperature)
+    response = llm.invoke(_build_messages(prompt, system))
+    return response.content
+
+
+@cached(ttl=_CACHE_TTL, namespace=MODEL, condition=_deterministic)
+async def acall_llm(prompt: str, max_tokens: int = 4096,
+                    system: Optional[list] = None,
+                    temperature: Optional[float] = 0.0) -> str:
+    """
+    Async version of call_llm.
+    
+    Awaits Claude without blocking the event loop, so other pending
+    calls can make progress while this one waits on the network.
+    At most LLM_CONCURRENCY calls run at once.
+    
+    Args:
+        prompt: The prompt to send
+        max_tokens: Maximum tokens in response
+        system: Optional system prompt blocks (see cached_block)
+        temperature: Sampling temperature (None for the API default);
+            other values than 0 are never cached
+        
+    Returns:
+        Claude's response as a string
+    """
+    llm = get_llm(max_tokens, temperature)
+    async with _get_semaphore():
+        response = await llm.ainvoke(_build_messages(prompt, system))
+    return response.content
+
+
+@cached(ttl=_CACHE_TTL, namespace=MODEL, condition=_deterministic)
+async def acall_llm_tool(prompt: str, tool: dict, max_tokens: int = 4096,
+                         system: Optional[list] = None,
+                         temperature: Optional[float] = 0.0) -> str:
+    """
+    Make Claude answer by calling one tool, for structured output.
+    
+    The tool is forced with tool_choice, so the reply is always a single
+    tool_use block whose input matches tool["input_schema"].
+    
+    Args:
+        prompt: The prompt to send
+        tool: Tool definition ({"name", "description", "input_schema"})
+        max_tokens: Maximum tokens in response
+        system: Optional system prompt blocks (see cached_block)
+        temperature: Sampling temperature (None for the API default);
+            other values than 0 are never cached
+        
+    Returns:
+        The tool call's arguments as a JSON string (strings are what the
+        response cache stores); decode with json.loads
+    """
+    llm = get_llm(max_tokens, temperature).bind_tools([tool], tool_choice=tool["name"])
+    async with _get_semaphore():
+        response = await llm.ainvoke(_build_messages(prompt, system))
+    
+    if not response.tool_calls:
+        raise ValueError(f"Claude did not call the {tool['name']} tool")
+    return json.dumps(response.tool_calls[0]["args"])
+
+
+async def astream_llm(prompt: str, max_tokens: int = 4096,
+                      system: Optional[list] = None,
+                      temperature: Optional[float] = 0.0) -> AsyncIterator[str]:
+    """
+    Stream Claude's response as it is generated.
+    
+    Shares entries with the acall_llm response cache: a cached response
+    is yielded as a single chunk, and a streamed one is stored once it
+    completes (both only at temperature 0).
+    
+    Args:
+        prompt: The prompt to send
+        max_tokens: Maximum tokens in response
+        system: Optional system prompt blocks (see cached_block)
+        temperature: Sampling temperature (None for the API default)
+        
+    Yields:
+        Pieces of Claude's response text
+    """
+    key = acall_llm.cache_key(prompt, max_tokens, system, temperature)
+    use_cache = CACHE_ENABLED and temperature == 0
+    if use_cache:
+        hit = get_cache().get(key, _CACHE_TTL)
+        if hit is not None:
+            yield hit
+            return
+    
+    llm = get_llm(max_tokens, temperature)
+    parts = []
+    async with _get_semaphore():
+        async for chunk in llm.astream(_build_messages(prompt, system)):
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+    
+    if use_cache:
+        get_cache().set(key, "".join(parts))
+
+
+async def collect(stream: AsyncIterator[str], on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Drain a stream into one string, optionally passing on each piece.
+    
+    Args:
+        stream: Iterator from astream_llm
+        on_text: Called with every piece as it arrives
+        
+    Returns:
+        The full response text
+    """
+    parts = []
+    async for text in stream:
+        if on_text is not None:
+            on_text(text)
+        parts.append(text)
+    return "".join(parts)
+
+
+async def awarm_prompt_cache(system: list) -> None:
+    """
+    Make Claude write the prompt cache for a set of system blocks.
+    
+    Sends the blocks with a throwaway one-token request, so a later call
+    that starts with the same blocks reads them from the cache. Bypasses
+    the response cache on purpose: the point is to reach the API.
+    
+    Args:
+        system: System prompt blocks (see cached_block)
+    """
+    llm = get_llm(1)
+    async with _get_semaphore():
+        await llm.ainvoke(_build_messages("Reply with OK.", system))
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+LLM Response Cache
+==================
+
+SQLite-backed cache for Claude responses.
+
+Replaying the same file + question (dev iterations, dashboard reloads)
+sends byte-identical prompts, so the responses can be served from local
+disk instead of paying for another round-trip.
+"""
+
+import os
+import time
+import json
+import sqlite3
+import asyncio
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+from concurrent.futures import Future
+from typing import Optional, Union
+
+# Set LLM_CACHE=0 to always call Claude
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+
+_TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# How often (seconds) a process deletes expired entries, on its next write
+PRUNE_INTERVAL = 3600
+
+logger = logging.getLogger("datalens.llm_cache")
+
+
+def parse_ttl(ttl: Union[int, str]) -> int:
+    """Convert a TTL like 3600, "30m", "12h" or "7d" to seconds."""
+    if isinstance(ttl, int):
+        return ttl
+    return int(ttl[:-1]) * _TTL_UNITS[ttl[-1]]
+
+
+def make_key(*parts) -> bytes:
+    """Hash any JSON-serializable parts into a fixed-size cache key."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+class ResponseCache:
+    """
+    Key/value store for LLM responses, backed by a SQLite file.
+    
+    Each thread gets its own connection (sqlite3 connections can't be
+    shared across threads); WAL mode lets readers and the writer run
+    at the same time.
+    
+    The cache is only an optimization: if the file can't be opened, read
+    or written (unwritable directory, locked or corrupt database), reads
+    are misses and writes are skipped, with one warning in the log.
+    Entries older than max_age are deleted from time to time on write.
+    """
+    
+    def __init__(self, path: str = CACHE_PATH, max_age: Union[int, str] = "7d"):
+        self.path = path
+        self.max_age = parse_ttl(max_age)
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._warned = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key BLOB PRIMARY KEY, response TEXT, created_at INT)"
+            )
+            self._local.conn = conn
+        return conn
+    
+    def _failed(self) -> None:
+        if not self._warned:
+            self._warned = True
+            logger.warning("Response cache at %s unavailable", self.path, exc_info=True)
+    
+    def get(self, key: bytes, ttl: int) -> Optional[str]:
+        """Return the stored response, or None if missing or older than ttl."""
+        try:
+            row = self._connect().execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except (sqlite3.Error, OSError):
+            self._failed()
+            return None
+        if row is None or row[1] < time.time() - ttl:
+            return None
+        return row[0]
+    
+    def set(self, key: bytes, response: str) -> None:
+        """Store a response under key (and prune expired entries now and then)."""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                (key, response, int(now))
+            )
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._last_prune = now
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?",
+                    (int(now - self.max_age),)
+                )
+            conn.commit()
+        except (sqlite3.Error, OSError):
+            self._failed()
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide response cache."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+# Calls currently in flight, so concurrent identical prompts (or whole
+# analyses, see run_analysis) share one request. concurrent.futures.Future
+# (not asyncio.Future) because callers may be on different threads and
+# event loops.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class InflightAbandoned(Exception):
+    """The owner of an in-flight call was cancelled; waiters should retry."""
+
+
+def claim_inflight(key: bytes):
+    """
+    Return (future, is_owner) for an in-flight call on key.
+    
+    The owner must resolve the future (or abandon_inflight it when it is
+    cancelled) and then call release_inflight; everyone else waits on it
+    (from async code with await_inflight).
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+
+def release_inflight(key: bytes, future: Future) -> None:
+    """Forget the in-flight call on key, unless someone else owns it by now."""
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def abandon_inflight(key: bytes, future: Future) -> None:
+    """
+    Give up an in-flight call whose owner was cancelled.
+    
+    The cancellation belongs to the owner alone, so instead of passing it
+    on, the waiters get InflightAbandoned and one of them takes over.
+    """
+    release_inflight(key, future)
+    future.set_exception(InflightAbandoned())
+
+
+async def await_inflight(future: Future):
+    """
+    Wait for another caller's in-flight call and return its result.
+    
+    Shielded, so a waiter being cancelled doesn't cancel the shared
+    future under the owner and the other waiters.
+    """
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def cached(ttl: Union[int, str] = "7d", namespace: str = "", condition=None):
+    """
+    Cache a function's string result in SQLite, keyed on its arguments.
+    
+    Works on both regular and async functions. Concurrent calls with the
+    same arguments wait for the first one instead of calling Claude again.
+    
+    Args:
+        ttl: How long a stored response stays valid ("7d", "12h", seconds)
+        namespace: Extra key component, e.g. the model name
+        condition: Optional condition(arguments) called with the bound
+            arguments (defaults applied); calls it returns False for go
+            straight to the function, uncached
+    """
+    ttl_seconds = parse_ttl(ttl)
+    
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def bind(args, kwargs) -> dict:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments
+        
+        def key_for(arguments: dict) -> bytes:
+            return make_key(namespace, func.__qualname__, arguments)
+        
+        def should_cache(arguments: dict) -> bool:
+            return CACHE_ENABLED and (condition is None or condition(arguments))
+        
+        # Lets callers that bypass the wrapper (e.g. streaming) share entries
+        def cache_key(*args, **kwargs) -> bytes:
+            return key_for(bind(args, kwargs))
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                arguments = bind(args, kwargs)
+                if not should_cache(arguments):
+                    return await func(*args, **kwargs)
+                
+                key = key_for(arguments)
+                while True:
+                    hit = get_cache().get(key, ttl_seconds)
+                    if hit is not None:
+                        return hit
+                    
+                    future, is_owner = claim_inflight(key)
+                    if is_owner:
+                        break
+                    try:
+                        return await await_inflight(future)
+                    except InflightAbandoned:
+                        # The owner was cancelled; take the call over
+                        continue
+                
+                try:
+                    result = await func(*args, **kwargs)
+                    get_cache().set(key, result)
+                    future.set_result(result)
+                    return result
+                except asyncio.CancelledError:
+                    abandon_inflight(key, future)
+                    raise
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                finally:
+                    release_inflight(key, future)
+            
+            async_wrapper.cache_key = cache_key
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = bind(args, kwargs)
+            if not should_cache(arguments):
+                return func(*args, **kwargs)
+            
+            key = key_for(arguments)
+            while True:
+                hit = get_cache().get(key, ttl_seconds)
+                if hit is not None:
+                    return hit
+                
+                future, is_owner = claim_inflight(key)
+                if is_owner:
+                    break
+                try:
+                    return future.result()
+                except InflightAbandoned:
+                    # The owner was cancelled; take the call over
+                    continue
+            
+            try:
+                result = func(*args, **kwargs)
+                get_cache().set(key, result)
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                abandon_inflight(key, future)
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                release_inflight(key, future)
+        
+        wrapper.cache_key = cache_key
+        return wrapper
+    
+    return decorator
@@ -4,16 +4,26 @@ Prompt Templates for DataLens AI
 Centralized prompt templates for all LLM interactions.
 """
 
-PLANNER_PROMPT = """You are a data analysis expert. Your job is to create a clear, step-by-step analysis plan.
+from string import Formatter
 
-## Dataset Information
+# --- Prompt caching ---
+# Every node that needs the dataset sends its description as the first
+# system block, followed by the node's fixed instructions, both marked for
+# Anthropic prompt caching (see dataset_system in app/utils/llm.py). Claude
+# caches prompt prefixes, so the planner, coder, debugger and their retries
+# all read the same cached dataset tokens. Only the per-request parts go in
+# the user message, so the cached prefix stays byte-identical across runs.
+
+DATASET_PROMPT = """## Dataset Information
 {schema_info}
 
 ## Sample Data
-{sample_rows}
+{sample_rows}"""
 
-## User's Question
-{user_question}
+
+PLANNER_SYSTEM_PROMPT = """You are a data analysis expert. Your job is to create a clear, step-by-step analysis plan.
+
+You will be given the dataset information and the user's question.
 
 ## Your Task
 Create a numbered analysis plan (3-6 steps) that will answer the user's question.
@@ -35,23 +45,17 @@ Example format:
 5. Summarize findings"""
 
 
-CODER_PROMPT = """You are a Python data analyst. Write clean, executable code to perform the analysis.
+PLANNER_PROMPT = """## User's Question
+{user_question}"""
 
-## Dataset Information
-{schema_info}
 
-## Sample Data
-{sample_rows}
+CODER_SYSTEM_PROMPT = """You are a Python data analyst. Write clean, executable code to perform the analysis.
 
-## Analysis Plan
-{analysis_plan}
-
-## User's Question
-{user_question}
+You will be given the dataset information, an analysis plan, the user's question and the path of the CSV file.
 
 ## Your Task
 Write Python code that:
-1. Loads the CSV from the file path: {file_path}
+1. Uses the pandas DataFrame `df`, which is already loaded from the CSV (do NOT read the file again)
 2. Follows the analysis plan step by step
 3. Prints clear results with labels
 4. Creates a Plotly visualization if appropriate
@@ -67,29 +71,67 @@ Write Python code that:
 
 ## Output Format
 Return ONLY the Python code, no explanations before or after.
-Do not wrap in markdown code blocks.
+Do not wrap in markdown code blocks."""
+
+
+CODER_PROMPT = """## Analysis Plan
+{analysis_plan}
+
+## User's Question
+{user_question}
+
+## File Path
+{file_path}
 
 Start your code:"""
 
 
-DEBUGGER_PROMPT = """You are a Python debugging expert. Fix the code that failed.
+# Planner + coder in one call (see app/nodes/plan_and_code.py)
+PLAN_AND_CODE_SYSTEM_PROMPT = """You are a Python data analyst. Plan an analysis that answers the user's question, then write the code that carries it out.
 
-## Original Code
-```python
-{generated_code}
-```
+You will be given the dataset information, the user's question and the path of the CSV file.
 
-## Error Message
-{execution_error}
+## Your Task
+1. Create a numbered analysis plan (3-6 steps):
+   - Each step should be specific and actionable
+   - Reference actual column names from the dataset
+   - Include what visualizations would help (if any)
+   - Consider edge cases (missing data, outliers)
+2. Write Python code that follows the plan step by step
+
+## Code Rules
+- Use the pandas DataFrame `df`, which is already loaded from the CSV (do NOT read the file again)
+- Use pandas for data manipulation
+- Use plotly.express for visualizations (NOT matplotlib)
+- Store any Plotly figure in a variable called `fig`
+- Print intermediate results with clear labels so we can see what's happening
+- Handle potential errors (missing values, wrong types)
+- Add brief comments explaining each step
+- DO NOT use `fig.show()` - just create the figure
 
-## Dataset Information
-{schema_info}
+## Output Format
+Call the emit_analysis tool exactly once, with the plan and the code.
+The code must be plain Python, not wrapped in markdown code blocks."""
+
+
+PLAN_AND_CODE_PROMPT = """## User's Question
+{user_question}
+
+## File Path
+{file_path}"""
+
+
+DEBUGGER_SYSTEM_PROMPT = """You are a Python debugging expert. Fix the code that failed.
+
+You will be given the dataset information, the original code and the error message it produced.
 
 ## Your Task
 1. Identify why the code failed
 2. Fix the issue
 3. Return the COMPLETE corrected code
 
+The code runs with the dataset already loaded into a pandas DataFrame called `df`.
+
 Common issues to check:
 - Column names might have spaces or different cases
 - Data types might need conversion
@@ -97,18 +139,24 @@ Common issues to check:
 - Import statements might be missing
 
 Return ONLY the fixed Python code, no explanations.
-Do not wrap in markdown code blocks.
+Do not wrap in markdown code blocks."""
 
-Fixed code:"""
 
+DEBUGGER_PROMPT = """## Original Code
+```python
+{generated_code}
+```
 
-REPORTER_PROMPT = """You are a data analyst presenting findings to a non-technical audience.
+## Error Message
+{execution_error}
 
-## User's Question
-{user_question}
+Fixed code:"""
 
-## Analysis Results
-{execution_result}
+
+REPORTER_SYSTEM_PROMPT = """You are a data analyst presenting findings to a non-technical audience.
+
+You will be given the user's question and the output of the analysis code.
+Very long output is shortened, with an "[output truncated ...]" marker where text was left out; base your report on what is shown.
 
 ## Your Task
 Write a clear, professional report that:
@@ -118,6 +166,55 @@ Write a clear, professional report that:
 4. Mentions any limitations or caveats
 5. Suggests follow-up questions if relevant
 
-Keep it concise but informative. Use bullet points for key findings.
+Keep it concise but informative. Use bullet points for key findings."""
+
+
+REPORTER_PROMPT = """## User's Question
+{user_question}
+
+## Analysis Results
+{execution_result}
 
-Report:"""
\ No newline at end of file
+Report:"""
+
+
+# --- Compiled templates ---
+class PromptTemplate:
+    """
+    A prompt template parsed once, at import time.
+    
+    str.format re-parses the template text on every call (and the debug
+    loop renders the same templates again on each retry). Here the
+    template is split into literal text and {field} slots up front, so
+    rendering is just filling the slots and one "".join.
+    """
+    
+    def __init__(self, template: str):
+        self._pieces = []
+        self._slots = []
+        
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if literal:
+                self._pieces.append(literal)
+            if field is not None:
+                if spec or conversion:
+                    raise ValueError(f"Unsupported placeholder in prompt: {{{field}}}")
+                self._slots.append((len(self._pieces), field))
+                self._pieces.append("")
+        
+        self.fields = frozenset(field for _, field in self._slots)
+    
+    def render(self, **values) -> str:
+        """Fill in the template; raises KeyError if a field is missing."""
+        pieces = self._pieces.copy()
+        for index, field in self._slots:
+            pieces[index] = str(values[field])
+        return "".join(pieces)
+
+
+render_planner = PromptTemplate(PLANNER_PROMPT).render
+render_dataset = PromptTemplate(DATASET_PROMPT).render
+render_coder = PromptTemplate(CODER_PROMPT).render
+render_plan_and_code = PromptTemplate(PLAN_AND_CODE_PROMPT).render
+render_debugger = PromptTemplate(DEBUGGER_PROMPT).render
+render_reporter = PromptTemplate(REPORTER_PROMPT).render
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Semantic Answer Cache
+=====================
+
+Reuses finished analyses for paraphrased questions.
+
+"What drives churn?" and "Which factors correlate with churn?" ask the
+same thing, but their prompts differ so the response cache never hits.
+Here the question is embedded locally and matched against earlier
+questions on the same dataset; close enough matches return the stored
+final state without calling Claude at all.
+
+Off by default: a close match returns the answer to a different
+question. Needs the optional `sentence-transformers` and `chromadb`
+packages; the cache is simply disabled when they are not installed or
+the embedding model can't be loaded.
+"""
+
+import os
+import json
+import logging
+import hashlib
+import threading
+from typing import Optional
+
+# Set SEMANTIC_CACHE=1 to reuse answers for paraphrased questions
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(".cache", "semantic_cache"))
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+logger = logging.getLogger("datalens.semantic_cache")
+
+
+def schema_fingerprint(column_types: dict, schema_info: str = "") -> str:
+    """
+    Identify a dataset so cached answers never leak across datasets.
+    
+    The column names and types alone would match two exports of the same
+    table with different rows, so the schema summary (row count, unique
+    counts, sample values) is hashed in as well.
+    """
+    payload = json.dumps([sorted(column_types.items()), schema_info])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """Question embeddings in a persistent Chroma collection, one namespace per dataset."""
+    
+    def __init__(self, path: str = SEMANTIC_CACHE_PATH,
+                 threshold: float = SIMILARITY_THRESHOLD):
+        import chromadb
+        from sentence_transformers import SentenceTransformer
+        
+        self.threshold = threshold
+        self._model = SentenceTransformer(EMBEDDING_MODEL)
+        client = chromadb.PersistentClient(path=path)
+        self._collection = client.get_or_create_collection(
+            "datalens_answers",
+            metadata={"hnsw:space": "cosine"}
+        )
+    
+    def _embed(self, question: str) -> list:
+        return self._model.encode(question, normalize_embeddings=True).tolist()
+    
+    def lookup(self, fingerprint: str, question: str) -> Optional[dict]:
+        """Return the stored final state for a similar question, or None."""
+        result = self._collection.query(
+            query_embeddings=[self._embed(question)],
+            n_results=1,
+            where={"namespace": fingerprint},
+            include=["metadatas", "distances"]
+        )
+        
+        if not result["ids"] or not result["ids"][0]:
+            return None
+        
+        # Cosine distance -> similarity
+        similarity = 1 - result["distances"][0][0]
+        if similarity < self.threshold:
+            return None
+        
+        return json.loads(result["metadatas"][0][0]["final_state"])
+    
+    def store(self, fingerprint: str, question: str, final_state: dict) -> None:
+        """Remember the final state of a finished analysis."""
+        entry_id = hashlib.sha256(f"{fingerprint}:{question}".encode("utf-8")).hexdigest()
+        self._collection.upsert(
+            ids=[entry_id],
+            embeddings=[self._embed(question)],
+            documents=[question],
+            metadatas=[{
+                "namespace": fingerprint,
+                "final_state": json.dumps(final_state, default=str)
+            }]
+        )
+
+
+_semantic_cache = None
+_unavailable = False
+_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """
+    Return the process-wide semantic cache, or None if it is disabled.
+    
+    The first call loads the embedding model (possibly downloading it),
+    so call it from a worker thread, not the event loop.
+    """
+    global _semantic_cache, _unavailable
+    
+    if not SEMANTIC_CACHE_ENABLED or _unavailable:
+        return None
+    
+    with _lock:
+        if _semantic_cache is None and not _unavailable:
+            try:
+                _semantic_cache = SemanticCache()
+            except ImportError:
+                # sentence-transformers / chromadb not installed
+                _unavailable = True
+            except Exception:
+                # e.g. the model download failed or Chroma can't open its files
+                logger.warning("Semantic cache disabled", exc_info=True)
+                _unavailable = True
+    
+    return _semantic_cache
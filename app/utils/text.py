@@ -0,0 +1,81 @@
+"""
+Text Utilities
+==============
+
+Helpers for cleaning up LLM output and formatting text for prompts.
+"""
+
+import re
+from typing import Iterable
+
+# A leading ```/```python fence line and a trailing ``` fence. Anchored to
+# the whole string, so fences inside the code are left alone.
+_MARKDOWN_FENCE = re.compile(r"\A\s*```[\w+-]*[ \t]*\n?|\n?```\s*\Z")
+
+
+def strip_markdown_fence(code: str) -> str:
+    """
+    Clean up LLM code output.
+    
+    Sometimes Claude wraps code in markdown blocks despite instructions.
+    This removes that wrapping in a single pass over the string.
+    """
+    return _MARKDOWN_FENCE.sub("", code).strip()
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """
+    Shorten text to about max_chars by cutting out its middle.
+    
+    Keeps the start and the end, where analysis output usually has its
+    setup and its final numbers, with a marker in place of the rest.
+    
+    Args:
+        text: Text to shorten
+        max_chars: Characters to keep (half from each end)
+        
+    Returns:
+        The text unchanged if it already fits, otherwise head + marker + tail
+    """
+    if len(text) <= max_chars:
+        return text
+    
+    head = max_chars // 2
+    tail = max_chars - head
+    omitted = len(text) - max_chars
+    return (
+        text[:head]
+        + f"\n... [output truncated: {omitted:,} characters omitted] ...\n"
+        + text[-tail:]
+    )
+
+
+def _md_cell(value) -> str:
+    """Render one table cell: None as blank, no line breaks, pipes escaped."""
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ").replace("|", "\\|")
+
+
+def md_table(columns: Iterable, rows: Iterable[Iterable]) -> str:
+    """
+    Format rows as a GitHub-style (pipe) markdown table.
+    
+    Only used for the handful of sample rows shown to Claude, so there
+    is no column alignment - the model doesn't need it.
+    
+    Args:
+        columns: Column names
+        rows: One sequence of values per row
+        
+    Returns:
+        The table, header and separator row first
+    """
+    columns = [_md_cell(col) for col in columns]
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "|" + "|".join("---" for _ in columns) + "|",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(_md_cell(value) for value in row) + " |")
+    return "\n".join(lines)
\ No newline at end of file
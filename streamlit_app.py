@@ -9,9 +9,19 @@ Run with: streamlit run streamlit_app.py
 
 import streamlit as st
 import pandas as pd
+import asyncio
+import hashlib
+import io
 import json
+import logging
 import os
+import queue
+import re
+import shutil
 import tempfile
+import threading
+import time
+import zipfile
 from datetime import datetime
 
 # Must be the first Streamlit command
@@ -24,6 +34,70 @@ st.set_page_config(
 
 # Import our agent
 from app.agent import run_analysis, create_agent, AgentState
+from app.tools.code_executor import prewarm_worker
+from app.utils.csv_utils import count_csv_rows
+
+
+logger = logging.getLogger("datalens.app")
+
+
+def _load_anthropic_sdk():
+    # Otherwise loaded by the first Claude call (see get_llm)
+    import langchain_anthropic  # noqa: F401
+
+
+def _warm_up():
+    # Each step is only an optimization; the analysis works without it,
+    # so a failing step is logged and the others still run
+    for step in (prewarm_worker, create_agent, _load_anthropic_sdk):
+        try:
+            step()
+        except Exception:
+            logger.warning("Warm-up step %s failed", step.__name__, exc_info=True)
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up() -> None:
+    """
+    Pay the one-time startup costs once per server, in the background.
+    
+    Starts an executor worker (which imports pandas/plotly in its own
+    process), compiles the agent graph and loads the Anthropic SDK while
+    the user is still uploading a file, instead of during the first
+    analysis. Runs on a thread so the page renders right away.
+    """
+    threading.Thread(target=_warm_up, daemon=True).start()
+
+
+# Uploads are stored as data/<content hash>/<file name>
+UPLOAD_ROOT = "data"
+_UPLOAD_DIR_NAME = re.compile(r"[0-9a-f]{32}")
+_UPLOAD_TEMP_PREFIX = ".upload-"
+
+# Upload directories no session has used for this long are deleted
+UPLOAD_TTL_SECONDS = 24 * 3600
+
+# Uploads are copied to disk this many bytes at a time
+_COPY_CHUNK = 4 * 1024 * 1024
+
+
+def remove_stale_uploads():
+    """Delete uploads (and unfinished copies) unused for UPLOAD_TTL_SECONDS."""
+    if not os.path.isdir(UPLOAD_ROOT):
+        return
+    
+    cutoff = time.time() - UPLOAD_TTL_SECONDS
+    for entry in os.scandir(UPLOAD_ROOT):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir() and _UPLOAD_DIR_NAME.fullmatch(entry.name):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.is_file() and entry.name.startswith(_UPLOAD_TEMP_PREFIX):
+                os.remove(entry.path)
+        except OSError:
+            # Already removed, e.g. by another session's sweep
+            pass
 
 
 def init_session_state():
@@ -34,22 +108,110 @@ def init_session_state():
         st.session_state.results = None
     if "uploaded_file_path" not in st.session_state:
         st.session_state.uploaded_file_path = None
+        
+        # A new session (or page reload): a cheap moment to clean up
+        remove_stale_uploads()
 
 
 def save_uploaded_file(uploaded_file) -> str:
-    """Save uploaded file to temp directory and return path."""
-    # Create data directory if it doesn't exist
-    os.makedirs("data", exist_ok=True)
+    """
+    Save an uploaded file under data/<content hash>/ and return its path.
+    
+    The directory is named after the file's contents, so a path never
+    gets different contents (no session overwrites a file another one is
+    analyzing), and sessions that upload the same file share one copy -
+    and with it the path-keyed DataFrame, node and run caches. Nothing is
+    deleted here; remove_stale_uploads() clears out unused uploads.
+    """
+    # The script reruns on every interaction; rewriting the same upload
+    # would change its mtime and invalidate the preview caches below
+    previous = st.session_state.get("uploaded_file_path")
+    if (st.session_state.get("saved_upload_id") == uploaded_file.file_id
+            and previous and os.path.exists(previous)):
+        # Still in use, so not stale
+        os.utime(os.path.dirname(previous))
+        return previous
+    
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
     
-    # Save with original filename
-    file_path = os.path.join("data", uploaded_file.name)
+    # Copy in chunks, hashing as we go, so writing never needs more than
+    # one chunk of extra memory however the upload is buffered; rewind
+    # afterwards so the upload can still be read from the start
+    digest = hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(
+        dir=UPLOAD_ROOT, prefix=_UPLOAD_TEMP_PREFIX, delete=False
+    ) as f:
+        while True:
+            chunk = uploaded_file.read(_COPY_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    uploaded_file.seek(0)
     
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    upload_dir = os.path.join(UPLOAD_ROOT, digest.hexdigest())
+    file_path = os.path.join(upload_dir, uploaded_file.name)
+    os.makedirs(upload_dir, exist_ok=True)
     
+    if os.path.exists(file_path):
+        # Same contents already uploaded; keep that copy and its mtime
+        os.remove(f.name)
+        os.utime(upload_dir)
+    else:
+        os.replace(f.name, file_path)
+    
+    st.session_state.saved_upload_id = uploaded_file.file_id
     return file_path
 
 
+@st.cache_data(show_spinner=False)
+def load_preview(file_path: str, mtime: float, size: int) -> pd.DataFrame:
+    """
+    First 10 rows of a CSV (mtime and size only key the cache).
+    
+    With nrows, pandas' C reader stops after the rows it needs, so the
+    preview reads a few KB even for a multi-GB upload. (Arrow's streaming
+    reader is slower here: it always parses a whole block first.)
+    """
+    return pd.read_csv(file_path, nrows=10)
+
+
+@st.cache_data(show_spinner=False)
+def count_rows(file_path: str, mtime: float, size: int) -> int:
+    """Number of data rows in a CSV, from a byte scan instead of a parse."""
+    return count_csv_rows(file_path)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_figure(figure_json: str):
+    """
+    Plotly figure from the agent's JSON, parsed once per figure.
+    
+    Every rerun (each tab click) redraws the results, and rebuilding the
+    figure validates every trace again. cache_resource returns the same
+    object rather than unpickling a copy the way cache_data would, which
+    costs nearly as much as the parse.
+    """
+    import plotly.io as pio
+    return pio.from_json(figure_json)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_bundle(report: str, code: str, stamp: str) -> bytes:
+    """
+    Zip of the report and the generated code, built once per analysis.
+    
+    Reruns get the same bytes back, so the download is compressed once
+    and one payload is held instead of one per file.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(f"analysis_report_{stamp}.md", report)
+        bundle.writestr(f"analysis_code_{stamp}.py", code)
+    return buffer.getvalue()
+
+
 def display_header():
     """Display the app header."""
     st.markdown("""
@@ -123,14 +285,16 @@ def display_file_uploader():
         st.success(f"✅ Uploaded: {uploaded_file.name}")
         
         with st.expander("📋 Data Preview", expanded=True):
-            df = pd.read_csv(file_path)
-            st.dataframe(df.head(10), use_container_width=True)
+            # Cached per file version, so reruns don't re-read the CSV
+            stat = os.stat(file_path)
+            preview = load_preview(file_path, stat.st_mtime, stat.st_size)
+            st.dataframe(preview, use_container_width=True)
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Rows", f"{len(df):,}")
+                st.metric("Rows", f"{count_rows(file_path, stat.st_mtime, stat.st_size):,}")
             with col2:
-                st.metric("Columns", len(df.columns))
+                st.metric("Columns", len(preview.columns))
             with col3:
                 st.metric("Size", f"{uploaded_file.size / 1024:.1f} KB")
         
@@ -152,59 +316,131 @@ def display_question_input():
     return question
 
 
+# Status text and progress shown when each agent node starts
+NODE_PROGRESS = {
+    "schema_analyzer": ("🔍 Analyzing schema...", 0.1),
+    "planner": ("📋 Creating analysis plan...", 0.3),
+    "plan_and_code": ("📋 Planning and generating code...", 0.3),
+    "coder": ("💻 Generating code...", 0.5),
+    "executor": ("🚀 Executing analysis...", 0.7),
+    "debugger": ("🔧 Fixing errors...", 0.7),
+    "reporter": ("📝 Generating report...", 0.9),
+}
+
+
 def run_analysis_with_progress(file_path: str, question: str):
-    """Run analysis and display progress."""
+    """
+    Run analysis and display progress.
+    
+    The agent runs on a background thread and reports back through a
+    queue. This (script) thread drains the queue and updates the page,
+    so the plan and code show up as soon as their nodes finish. All
+    Streamlit calls stay on this thread.
+    """
     
     st.markdown("### ⚙️ Analysis in Progress")
     
-    # Create progress container
-    progress_container = st.container()
-    
-    with progress_container:
-        # Progress steps
-        steps = [
-            ("🔍 Analyzing schema...", 0.1),
-            ("📋 Creating analysis plan...", 0.3),
-            ("💻 Generating code...", 0.5),
-            ("🚀 Executing analysis...", 0.7),
-            ("📝 Generating report...", 0.9),
-        ]
-        
+    # (kind, node, payload) tuples from the agent thread
+    events = queue.Queue()
+    
+    def run():
+        try:
+            results = asyncio.run(run_analysis(
+                file_path,
+                question,
+                on_token=lambda node, text: events.put(("token", node, text)),
+                on_progress=lambda node: events.put(("progress", node, None)),
+                on_update=lambda node, update: events.put(("update", node, update))
+            ))
+            events.put(("done", None, results))
+        except BaseException as e:
+            # Whatever ends the run (CancelledError included), the script
+            # thread below is waiting for this event
+            events.put(("error", None, e))
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    with st.status("Analyzing...", expanded=True) as status:
         progress_bar = st.progress(0)
         status_text = st.empty()
         
         # Show initial status
         status_text.text("Starting analysis...")
         
-        # Simulate progress for each step
-        import time
-        for step_text, progress in steps:
-            status_text.text(step_text)
-            progress_bar.progress(progress)
-            time.sleep(0.5)  # Brief pause for visual feedback
-        
-        # Actually run the analysis
-        status_text.text("🔄 Processing...")
+        # Filled in as the nodes finish (code also while it is streamed)
+        plan_box = st.empty()
+        code_box = st.empty()
+        live_output = st.empty()
+        streamed = {}
         
-        try:
-            results = run_analysis(file_path, question)
-            progress_bar.progress(1.0)
-            status_text.text("✅ Analysis complete!")
+        while True:
+            kind, node, payload = events.get()
+            
+            if kind == "progress":
+                # Driven by the agent as its nodes actually start
+                if node in NODE_PROGRESS:
+                    step_text, progress = NODE_PROGRESS[node]
+                    status_text.text(step_text)
+                    progress_bar.progress(progress)
+            
+            elif kind == "token":
+                # Show the code and report while Claude is still writing them
+                streamed[node] = streamed.get(node, "") + payload
+                if node == "coder":
+                    code_box.code(streamed[node], language="python")
+                else:
+                    live_output.markdown(streamed[node])
             
-            return results
+            elif kind == "update":
+                if payload.get("analysis_plan"):
+                    plan_box.markdown("**📋 Analysis Plan**\n\n" + payload["analysis_plan"])
+                if payload.get("generated_code"):
+                    code_box.code(payload["generated_code"], language="python")
             
-        except Exception as e:
-            status_text.text("❌ Analysis failed")
-            st.error(f"Error: {str(e)}")
-            return None
+            elif kind == "done":
+                live_output.empty()
+                progress_bar.progress(1.0)
+                status_text.text("✅ Analysis complete!")
+                status.update(label="✅ Analysis complete!", state="complete", expanded=False)
+                
+                return payload
+            
+            else:
+                status_text.text("❌ Analysis failed")
+                status.update(label="❌ Analysis failed", state="error")
+                st.error(f"Error: {str(payload) or type(payload).__name__}")
+                return None
 
 
+@st.fragment
 def display_results(results: dict):
-    """Display analysis results."""
+    """
+    Display analysis results.
+    
+    A fragment: clicking a download button here reruns only this
+    section, not the upload preview and the rest of the page.
+    """
     
     st.markdown("---")
     st.markdown("## 📊 Analysis Results")
     
+    report_text = results.get("final_report", "")
+    code = results.get("generated_code", "")
+    
+    # Fixed per analysis: a file name that changed on every rerun would
+    # make Streamlit store the download again each time
+    stamp = st.session_state.get("results_stamp") or datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    # With both files there is a single download for the two of them
+    bundled = bool(report_text and code)
+    if bundled:
+        st.download_button(
+            label="📥 Download Report + Code",
+            data=build_bundle(report_text, code, stamp),
+            file_name=f"analysis_{stamp}.zip",
+            mime="application/zip"
+        )
+    
     # Tabs for different result sections
     tab1, tab2, tab3, tab4 = st.tabs([
         "📝 Report", 
@@ -219,12 +455,11 @@ def display_results(results: dict):
         st.markdown(results.get("final_report", "No report generated"))
         
         # Download button for report
-        report_text = results.get("final_report", "")
-        if report_text:
+        if report_text and not bundled:
             st.download_button(
                 label="📥 Download Report",
                 data=report_text,
-                file_name=f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                file_name=f"analysis_report_{stamp}.md",
                 mime="text/markdown"
             )
     
@@ -236,9 +471,7 @@ def display_results(results: dict):
         
         if figure_json:
             try:
-                import plotly.io as pio
-                fig = pio.from_json(figure_json)
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(load_figure(figure_json), use_container_width=True)
             except Exception as e:
                 st.warning(f"Could not display figure: {e}")
         else:
@@ -248,17 +481,17 @@ def display_results(results: dict):
     with tab3:
         st.markdown("### Generated Python Code")
         
-        code = results.get("generated_code", "")
         if code:
             st.code(code, language="python")
             
             # Download button for code
-            st.download_button(
-                label="📥 Download Code",
-                data=code,
-                file_name=f"analysis_code_{datetime.now().strftime('%Y%m%d_%H%M%S')}.py",
-                mime="text/plain"
-            )
+            if not bundled:
+                st.download_button(
+                    label="📥 Download Code",
+                    data=code,
+                    file_name=f"analysis_code_{stamp}.py",
+                    mime="text/plain"
+                )
         else:
             st.info("No code was generated.")
     
@@ -306,6 +539,9 @@ def display_execution_details(results: dict):
 def main():
     """Main application entry point."""
     
+    # Warm up imports and the executor (first run on this server only)
+    start_warm_up()
+    
     # Initialize session state
     init_session_state()
     
@@ -330,12 +566,12 @@ def main():
             
             if st.button("🚀 Analyze Data", type="primary", use_container_width=True):
                 if question:
-                    with st.spinner("Running analysis..."):
-                        results = run_analysis_with_progress(file_path, question)
-                        
-                        if results:
-                            st.session_state.results = results
-                            st.session_state.analysis_complete = True
+                    results = run_analysis_with_progress(file_path, question)
+                    
+                    if results:
+                        st.session_state.results = results
+                        st.session_state.results_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                        st.session_state.analysis_complete = True
                 else:
                     st.warning("Please enter a question about your data.")
     